@@ -0,0 +1,30 @@
+"""Add node instance id and states
+
+Revision ID: 0b1f6c2a7d94
+Revises: 6e391335e2d2
+Create Date: 2026-10-18 10:12:41.530218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b1f6c2a7d94'
+down_revision = '6e391335e2d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('nodes', sa.Column('instance_id', sa.String(), nullable=True))
+    op.create_index(op.f('ix_nodes_instance_id'), 'nodes', ['instance_id'], unique=True)
+    with op.get_context().autocommit_block():
+        for state in ('stopping', 'stopped', 'shutting_down', 'terminated'):
+            op.execute(f"ALTER TYPE nodestate ADD VALUE IF NOT EXISTS '{state}'")
+
+
+def downgrade() -> None:
+    # Postgres cannot drop enum values, the added node states are kept
+    op.drop_index(op.f('ix_nodes_instance_id'), table_name='nodes')
+    op.drop_column('nodes', 'instance_id')
@@ -0,0 +1,33 @@
+"""Add warm pool node columns
+
+Revision ID: b7d41e9f0c52
+Revises: 9c3a7e5b21d8
+Create Date: 2026-10-18 13:37:12.664090
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41e9f0c52'
+down_revision = '9c3a7e5b21d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('nodes', sa.Column('region', sa.String(), nullable=True))
+    op.add_column('nodes', sa.Column('instance_type', sa.String(), nullable=True))
+    op.add_column('nodes', sa.Column('image_id', sa.String(), nullable=True))
+    op.add_column('nodes', sa.Column('from_warm_pool', sa.Boolean(), server_default='false', nullable=False))
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE nodestate ADD VALUE IF NOT EXISTS 'standby'")
+
+
+def downgrade() -> None:
+    # Postgres cannot drop enum values, the standby node state is kept
+    op.drop_column('nodes', 'from_warm_pool')
+    op.drop_column('nodes', 'image_id')
+    op.drop_column('nodes', 'instance_type')
+    op.drop_column('nodes', 'region')
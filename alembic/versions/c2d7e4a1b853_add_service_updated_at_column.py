@@ -0,0 +1,29 @@
+"""Add service updated at column
+
+Revision ID: c2d7e4a1b853
+Revises: a8e5c3f90d17
+Create Date: 2026-10-18 20:14:05.371826
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d7e4a1b853'
+down_revision = 'a8e5c3f90d17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('services', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    # Built concurrently so launches keep writing to the table meanwhile
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_services_updated_at'), 'services', ['updated_at'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_services_updated_at'), table_name='services', postgresql_concurrently=True)
+    op.drop_column('services', 'updated_at')
@@ -0,0 +1,46 @@
+"""Add hot lookup indexes
+
+Revision ID: d5a9c3f17e48
+Revises: b7d41e9f0c52
+Create Date: 2026-10-18 16:05:27.318842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a9c3f17e48'
+down_revision = 'b7d41e9f0c52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Built concurrently so launches keep writing to the tables meanwhile
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_nodes_service_id'), 'nodes', ['service_id'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_key_pairs_service_id'), 'key_pairs', ['service_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_services_value_id', 'services', ['value', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index(
+            'ix_services_name_pattern', 'services', ['name'], unique=False,
+            postgresql_ops={'name': 'text_pattern_ops'}, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_nodes_standby_pool', 'nodes', ['region', 'instance_type', 'image_id'], unique=False,
+            postgresql_where=sa.text("value = 'standby'"), postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_nodes_active_instance_id', 'nodes', ['instance_id'], unique=False,
+            postgresql_where=sa.text("value <> 'terminated' AND instance_id IS NOT NULL"), postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_nodes_active_instance_id', table_name='nodes', postgresql_concurrently=True)
+        op.drop_index('ix_nodes_standby_pool', table_name='nodes', postgresql_concurrently=True)
+        op.drop_index('ix_services_name_pattern', table_name='services', postgresql_concurrently=True)
+        op.drop_index('ix_services_value_id', table_name='services', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_key_pairs_service_id'), table_name='key_pairs', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_nodes_service_id'), table_name='nodes', postgresql_concurrently=True)
@@ -1,7 +1,8 @@
 from fastapi import APIRouter
-from api.endpoints import service
+from api.endpoints import service, warm_pool
 
 
 api_router = APIRouter()
 
 api_router.include_router(service.router, prefix="/service", tags=["services"])
+api_router.include_router(warm_pool.router, prefix="/warm-pool", tags=["warm pools"])
@@ -1,6 +1,6 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
-from db.session import SessionLocal
+from db.session import AsyncSessionLocal, SessionLocal
 
 
 def get_db() -> Generator:
@@ -9,3 +9,8 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
+        yield db
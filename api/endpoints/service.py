@@ -1,28 +1,134 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from typing import Any, Awaitable, Callable, List
+from celery import group
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import schemas
 import crud
-from api.deps import get_db
-from core.magic import ServiceState
-from worker import create_service_task
+from api.deps import get_async_db
+from core import events, response_cache, tasks
+from core.magic import NEXT_CURSOR_HEADER, SERVICE_PAGE_DEFAULT_LIMIT, SERVICE_PAGE_MAX_LIMIT, ServiceState
 
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[schemas.Service])
-def list_services(db: Session = Depends(get_db),) -> Any:
-    return crud.service.get_multi(db=db)
+async def list_services(
+    request: Request,
+    cursor: int | None = Query(None, description="Last service id of the previous page"),
+    limit: int = Query(SERVICE_PAGE_DEFAULT_LIMIT, ge=1, le=SERVICE_PAGE_MAX_LIMIT),
+    state: ServiceState | None = None,
+    name_prefix: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+) -> Any:
+    """Keyset paginated service listing.
+
+    The id to pass as `cursor` for the next page is returned in the `X-Next-Cursor` header.
+    Responses carry an `ETag` and `Last-Modified` of the whole collection.
+    """
+    async def read() -> ORJSONResponse:
+        rows = await crud.service.aget_page_filtered(
+            db=db, cursor=cursor, limit=limit, state=state, name_prefix=name_prefix
+        )
+        headers = {}
+        if len(rows) == limit:
+            headers[NEXT_CURSOR_HEADER] = str(rows[-1]["id"])
+        # Rows are plain column mappings, skip response model validation and let orjson encode them
+        return ORJSONResponse([dict(row) for row in rows], headers=headers)
+
+    return await _conditional_read(request, db, None, read)
 
 
 @router.post("/", response_model=schemas.Service)
-def create_service(service_in: schemas.ServiceCreateRequest, db: Session = Depends(get_db)) -> Any:
-    service_orm = crud.service.create(
+async def create_service(service_in: schemas.ServiceCreateRequest, db: AsyncSession = Depends(get_async_db)) -> Any:
+    service_orm = await crud.service.acreate(
         db=db, obj_in=schemas.ServiceCreate(
-            name=service_in.name, state=ServiceState.initialized)
+            name=service_in.name, region=service_in.region, state=ServiceState.initialized)
     )
     service = schemas.Service.from_orm(service_orm)
-    create_service_task.delay(service.id)
+    await events.apublish([_initialized_event(service.id)])
+    # Publishing to the broker is blocking I/O, keep it off the event loop
+    await run_in_threadpool(tasks.create_service(service.id, service.region).delay)
     return service
+
+
+@router.post("/bulk", response_model=schemas.ServiceBulkCreateResponse)
+async def create_services(
+    services_in: schemas.ServiceBulkCreateRequest, db: AsyncSession = Depends(get_async_db)
+) -> Any:
+    """Create many services with one insert, names that already exist are reported as conflicts."""
+    created, conflicts = await crud.service.acreate_bulk(
+        db=db, objs_in=[
+            schemas.ServiceCreate(name=service_in.name, region=service_in.region, state=ServiceState.initialized)
+            for service_in in services_in.services
+        ]
+    )
+    if created:
+        await events.apublish(_initialized_event(row["id"]) for row in created)
+        launches = group(tasks.create_service(row["id"], row["region"]) for row in created)
+        await run_in_threadpool(launches.apply_async)
+    return ORJSONResponse({"created": [dict(row) for row in created], "conflicts": conflicts})
+
+
+@router.get("/events", response_class=StreamingResponse)
+async def stream_service_events(service_id: int | None = None) -> Any:
+    """Server-sent events of service and node state transitions, optionally of a single service.
+
+    Each event carries a JSON object with `service_id`, `resource` (`service` or `node`), `id` and `state`.
+    """
+    async def event_stream():
+        async for data in events.stream(service_id):
+            if data is None:
+                # Keeps proxies from closing an idle connection
+                yield b": keepalive\n\n"
+            else:
+                yield b"event: state\ndata: " + data + b"\n\n"
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.get("/{service_id}", response_model=schemas.Service)
+async def read_service(request: Request, service_id: int, db: AsyncSession = Depends(get_async_db)) -> Any:
+    """A single service, responses carry an `ETag` and `Last-Modified` of the service."""
+    async def read() -> ORJSONResponse:
+        service_orm = await crud.service.aget(db=db, id=service_id)
+        if service_orm is None:
+            raise HTTPException(status_code=404, detail="Service not found")
+        return ORJSONResponse(schemas.Service.from_orm(service_orm).dict())
+
+    return await _conditional_read(request, db, service_id, read)
+
+
+async def _conditional_read(
+    request: Request, db: AsyncSession, service_id: int | None, read: Callable[[], Awaitable[ORJSONResponse]]
+) -> Response:
+    """Answer from the client's copy or the response cache, `read` only runs for a miss."""
+    validator = await response_cache.get_validator(db, service_id)
+    if validator is None:
+        return await read()
+    if validator.not_modified(request):
+        return Response(status_code=304, headers=validator.headers)
+    key = response_cache.cache_key(validator, request.url.path, request.url.query)
+    cached = await response_cache.load(key)
+    if cached is None:
+        response = await read()
+        cached = response_cache.CachedResponse(
+            body=response.body,
+            headers={
+                name: value for name, value in response.headers.items()
+                if name not in ("content-length", "content-type")
+            },
+        )
+        await response_cache.store(key, cached)
+    return Response(cached.body, media_type="application/json", headers={**cached.headers, **validator.headers})
+
+
+def _initialized_event(service_id: int) -> events.StateEvent:
+    return events.StateEvent(
+        service_id=service_id, resource=events.SERVICE, id=service_id, state=ServiceState.initialized.value
+    )
@@ -0,0 +1,41 @@
+from typing import Any, List
+from fastapi import APIRouter, Depends
+from redis import RedisError
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import schemas
+from api.deps import get_async_db
+from core.config import settings
+from core.redis import get_async_redis
+from core.warm_pool import HIT, MISS, counter_key, standby_filters
+
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[schemas.WarmPoolStats])
+async def list_warm_pools(db: AsyncSession = Depends(get_async_db)) -> Any:
+    """Configured warm pools with their standby nodes and claim hit/miss counts."""
+    redis = get_async_redis()
+    pools = []
+    for pool in settings.WARM_POOLS:
+        standby = await db.scalar(select(func.count(models.Node.id)).where(*standby_filters(pool)))
+        try:
+            hits, misses = [
+                int(count or 0) for count in await redis.mget(counter_key(pool, HIT), counter_key(pool, MISS))
+            ]
+        except RedisError:
+            # The counters live in redis, the standby count is still current without it
+            hits = misses = None
+        pools.append(schemas.WarmPoolStats(
+            region=pool.region,
+            instance_type=pool.instance_type,
+            image_id=pool.image_id,
+            size=pool.size,
+            standby=standby,
+            hits=hits,
+            misses=misses,
+        ))
+    return pools
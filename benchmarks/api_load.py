@@ -0,0 +1,187 @@
+"""Load of the service routes against a database seeded with a realistic volume.
+
+Seeds `services`, `nodes` and `key_pairs` of the configured Postgres, then drives each
+workload with concurrent requests against the API app in-process and reports
+throughput, latency percentiles and the peak RSS of the process. Seeded and created
+rows are deleted afterwards unless `--keep` is given. Create requests enqueue launch
+tasks, they are purged from the broker at the end, only run this against stand-ins.
+
+    python -m benchmarks.api_load --services 100000 --duration 30 --output api_load.json
+"""
+import argparse
+import asyncio
+import random
+import resource
+import secrets
+import time
+import uuid
+from typing import Callable, Dict, List, Sequence
+
+import httpx
+import orjson
+from sqlalchemy import delete, insert, select
+
+from benchmarks import common
+from core.lifespan import LifespanManager
+from core.magic import SERVICE_PAGE_DEFAULT_LIMIT, AWSInstanceType, AWS_DEFAULT_AMI_ID, AWS_DEFAULT_REGION, NodeState, ServiceState
+from core.tasks import celery
+from db.session import SessionLocal
+from main import app
+import models
+
+SEED_BATCH_SIZE = 10000
+
+WORKLOADS = ("list", "list_by_state", "list_by_name_prefix", "detail", "create")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=100000, help="services to seed")
+    parser.add_argument("--nodes-per-service", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent requests")
+    parser.add_argument("--duration", type=float, default=30, help="seconds each workload runs")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"comma separated subset of {WORKLOADS}")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    parser.add_argument("--output", default="api_load.json")
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    return parser.parse_args()
+
+
+def peak_rss_mb() -> float:
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(prefix: str, services: int, nodes_per_service: int, node_states: Sequence[NodeState] = (NodeState.running,)) -> List[int]:
+    """Insert the synthetic rows in batches, returns the seeded service ids.
+
+    Node states are assigned round robin from `node_states`.
+    """
+    service_ids = []
+    states = list(ServiceState)
+    with SessionLocal() as session:
+        for offset in range(0, services, SEED_BATCH_SIZE):
+            batch = range(offset, min(offset + SEED_BATCH_SIZE, services))
+            ids = session.scalars(
+                insert(models.Service).returning(models.Service.id, sort_by_parameter_order=True),
+                [
+                    {"name": f"{prefix}-{i}", "state": states[i % len(states)], "public_ip_address": f"10.0.{i // 256 % 256}.{i % 256}"}
+                    for i in batch
+                ],
+            ).all()
+            session.execute(insert(models.KeyPair), [
+                {
+                    "name": f"{prefix}-{i}", "key_fingerprint": secrets.token_hex(20),
+                    "key_material": secrets.token_urlsafe(1200), "service_id": service_id,
+                }
+                for i, service_id in zip(batch, ids)
+            ])
+            session.execute(insert(models.Node), [
+                {
+                    "state": node_states[(i * nodes_per_service + n) % len(node_states)], "service_id": service_id,
+                    "instance_id": f"i-{prefix}-{i}-{n}", "region": AWS_DEFAULT_REGION,
+                    "instance_type": AWSInstanceType.t2_micro.value, "image_id": AWS_DEFAULT_AMI_ID,
+                }
+                for i, service_id in zip(batch, ids) for n in range(nodes_per_service)
+            ])
+            session.commit()
+            service_ids.extend(ids)
+    return service_ids
+
+
+def clean_up(prefix: str) -> None:
+    with SessionLocal() as session:
+        service_ids = select(models.Service.id).where(models.Service.name.startswith(prefix))
+        session.execute(delete(models.LaunchCheckpoint).where(models.LaunchCheckpoint.service_id.in_(service_ids)))
+        session.execute(delete(models.KeyPair).where(models.KeyPair.service_id.in_(service_ids)))
+        session.execute(delete(models.Node).where(models.Node.service_id.in_(service_ids)))
+        session.execute(delete(models.Service).where(models.Service.name.startswith(prefix)))
+        session.commit()
+
+
+def request_factories(prefix: str, service_ids: List[int]) -> Dict[str, Callable[[], tuple]]:
+    """Per workload a function returning the (method, url, json body) of the next request."""
+    created = iter(range(10 ** 9))
+    low, high = min(service_ids), max(service_ids)
+    return {
+        "list": lambda: ("GET", f"/api/service/?cursor={random.randint(low, high)}&limit={SERVICE_PAGE_DEFAULT_LIMIT}", None),
+        "list_by_state": lambda: ("GET", f"/api/service/?state={random.choice(list(ServiceState)).value}&cursor={random.randint(low, high)}", None),
+        "list_by_name_prefix": lambda: ("GET", f"/api/service/?name_prefix={prefix}-{random.randint(1, 9)}", None),
+        "detail": lambda: ("GET", f"/api/service/{random.choice(service_ids)}", None),
+        "create": lambda: ("POST", "/api/service/", {"name": f"{prefix}-created-{next(created)}"}),
+    }
+
+
+async def run_workload(client: httpx.AsyncClient, next_request: Callable[[], tuple], *, concurrency: int, duration: float) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def user() -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            method, url, body = next_request()
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / elapsed,
+        "latency_seconds": common.summarize(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def drive(args: argparse.Namespace, prefix: str, service_ids: List[int]) -> dict:
+    LifespanManager.startup()
+    factories = request_factories(prefix, service_ids)
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark", limits=limits, timeout=60) as client:
+        for workload in args.workloads.split(","):
+            results[workload] = await run_workload(
+                client, factories[workload], concurrency=args.concurrency, duration=args.duration
+            )
+            print(workload, orjson.dumps(results[workload]).decode())
+    return results
+
+
+def main() -> None:
+    args = parse_args()
+    prefix = f"load-{uuid.uuid4().hex[:8]}"
+    started = time.perf_counter()
+    service_ids = seed(prefix, args.services, args.nodes_per_service)
+    seed_seconds = time.perf_counter() - started
+    rss_before_load = peak_rss_mb()
+    try:
+        workloads = asyncio.run(drive(args, prefix, service_ids))
+    finally:
+        if "create" in args.workloads:
+            celery.control.purge()
+        if not args.keep:
+            clean_up(prefix)
+
+    results = {
+        "seed_seconds": seed_seconds,
+        "peak_rss_mb_before_load": rss_before_load,
+        "peak_rss_mb": peak_rss_mb(),
+        "workloads": workloads,
+    }
+    parameters = {
+        key: getattr(args, key)
+        for key in ("services", "nodes_per_service", "concurrency", "duration", "workloads")
+    }
+    report = common.write_results(args.output, "api_load", parameters, results)
+    if args.baseline:
+        print("\n".join(common.compare(report, args.baseline)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Local stand-ins and reporting shared by the benchmarks."""
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence
+
+import orjson
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, *, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing listens on port {port} after {timeout}s")
+
+
+def start_moto_server():
+    """EC2 stand-in, requires moto[server]."""
+    from moto.server import ThreadedMotoServer
+
+    port = free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def start_process(args: Sequence[str], env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(args, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_process(process: subprocess.Popen, timeout: float = 30) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def percentile(values: Sequence[float], q: float) -> float | None:
+    """Nearest rank percentile, `q` in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float | None]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: str, benchmark: str, parameters: dict, results: dict) -> dict:
+    """Write the results with enough context to compare them with runs of other commits."""
+    report = {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(path, "wb") as file:
+        file.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    return report
+
+
+def compare(report: dict, baseline_path: str) -> List[str]:
+    """Relative change of every numeric result against an earlier report."""
+    with open(baseline_path, "rb") as file:
+        baseline = orjson.loads(file.read())
+    lines = [f"Compared with {baseline.get('commit')} ({baseline.get('timestamp')})"]
+
+    def walk(current, previous, prefix):
+        for key, value in current.items():
+            before = previous.get(key) if isinstance(previous, dict) else None
+            name = f"{prefix}{key}"
+            if isinstance(value, dict):
+                walk(value, before, f"{name}.")
+            elif isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+                lines.append(f"  {name}: {before:.4g} -> {value:.4g} ({(value - before) / before:+.1%})")
+
+    walk(report["results"], baseline.get("results", {}), "")
+    return lines
@@ -0,0 +1,88 @@
+"""Import time of the API, the cost every API process and autoscaled cold start pays.
+
+Imports the module in fresh interpreters with `-X importtime` and reports the median
+and best cumulative import time, the most expensive imports and whether modules that
+belong to the worker only were loaded, in which case it exits non-zero. Importing the
+API must not touch the database, so no stand-ins are needed.
+
+    python -m benchmarks.import_time --runs 10 --output import_time.json
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+import orjson
+
+from benchmarks import common
+
+# Modules the API must leave to the worker
+WORKER_ONLY_MODULES = ("boto3", "paramiko", "worker", "core.services", "core.ssh", "core.aws")
+
+PROBE = "import {module}, sys, json; print(json.dumps(sorted(set(sys.modules) & set({forbidden!r}))))"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module to import")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="most expensive imports to report")
+    parser.add_argument("--output", default="import_time.json")
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    return parser.parse_args()
+
+
+def import_once(module: str) -> Tuple[Dict[str, int], List[str]]:
+    """Cumulative import time in microseconds by module and the worker only modules that were loaded."""
+    env = {
+        # Values are never used to connect, importing must not open connections
+        "POSTGRES_SERVER": "localhost", "POSTGRES_USER": "benchmark", "POSTGRES_PASSWORD": "benchmark",
+        "POSTGRES_DB": "benchmark", "CELERY_BROKER_URL": "redis://localhost:6379/0",
+        "AWS_ACCESS_KEY_ID": "benchmark", "AWS_SECRET_ACCESS_KEY": "benchmark",
+        **os.environ,
+    }
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, forbidden=WORKER_ONLY_MODULES)],
+        cwd=common.ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, _, times = line.partition(":")
+        _, total, name = (part.strip() for part in times.split("|"))
+        # The first import of a module is the one that costs
+        cumulative.setdefault(name, int(total))
+    return cumulative, orjson.loads(completed.stdout)
+
+
+def main() -> None:
+    args = parse_args()
+    runs = [import_once(args.module) for _ in range(args.runs)]
+    totals = [cumulative[args.module] / 1e6 for cumulative, _ in runs]
+    last_run, loaded = runs[-1]
+    top = sorted(
+        ((name, total) for name, total in last_run.items() if name != args.module),
+        key=lambda item: item[1], reverse=True,
+    )[:args.top]
+    results = {
+        "import_seconds": {"median": statistics.median(totals), "min": min(totals), "max": max(totals)},
+        "modules": len(last_run),
+        "worker_only_modules_loaded": loaded,
+    }
+    report = common.write_results(
+        args.output, "import_time", {"module": args.module, "runs": args.runs}, {**results, "slowest": dict(top)}
+    )
+    print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
+    for name, total in top:
+        print(f"  {total / 1000:8.1f} ms  {name}")
+    if args.baseline:
+        print("\n".join(common.compare(report, args.baseline)))
+    if loaded:
+        sys.exit(f"{args.module} imports worker only modules: {', '.join(loaded)}")
+
+
+if __name__ == "__main__":
+    main()
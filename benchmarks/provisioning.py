@@ -0,0 +1,198 @@
+"""Provisioning throughput of the whole control plane against local stand-ins.
+
+Starts moto as EC2, an SSH server that accepts any key, a celery worker pool and the
+API, creates services concurrently through `POST /api/service/` and follows the state
+event stream until every service is running. Postgres and redis are the ones of the
+environment, e.g. those of docker-compose.yml, waiting tasks in the broker are purged.
+
+    python -m benchmarks.provisioning --services 200 --concurrency 50 --output provisioning.json
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+import orjson
+from celery import Celery
+from sqlalchemy import create_engine, text
+
+from benchmarks import common
+from benchmarks.ssh_standin import SSHStandIn
+from core.config import settings
+
+DB_CONNECTIONS_QUERY = text(
+    "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=100, help="services to create")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent create requests")
+    parser.add_argument("--worker-concurrency", type=int, default=8, help="celery worker processes")
+    parser.add_argument("--command-delay", type=float, default=0.5, help="seconds every SSH command takes")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for all services to run")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="seconds between DB connection samples")
+    parser.add_argument("--output", default="provisioning.json")
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    return parser.parse_args()
+
+
+def wait_for_worker(timeout: float = 60) -> None:
+    app = Celery(broker=settings.CELERY_BROKER_URL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if app.control.ping(timeout=1):
+            return
+    raise TimeoutError(f"No celery worker answered within {timeout}s")
+
+
+async def follow_running(client: httpx.AsyncClient, running: Dict[int, float], subscribed: asyncio.Event) -> None:
+    """Record when each service reaches the running state."""
+    async with client.stream("GET", "/api/service/events", timeout=None) as response:
+        subscribed.set()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = orjson.loads(line[len("data: "):])
+            if event["resource"] == "service" and event["state"] == "running":
+                running.setdefault(event["service_id"], time.perf_counter())
+
+
+async def sample_db_connections(engine, interval: float, samples: List[int], stop: asyncio.Event) -> None:
+    def sample() -> int:
+        with engine.connect() as connection:
+            return connection.execute(DB_CONNECTIONS_QUERY).scalar_one()
+
+    while not stop.is_set():
+        samples.append(await asyncio.to_thread(sample))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def create_services(
+    client: httpx.AsyncClient, names: List[str], concurrency: int, submitted: Dict[int, float], latencies: List[float]
+) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def create(name: str) -> None:
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/api/service/", json={"name": name})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures += 1
+                return
+            submitted[response.json()["id"]] = started
+
+    await asyncio.gather(*(create(name) for name in names))
+    return failures
+
+
+async def drive(args: argparse.Namespace, api_url: str) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    names = [f"bench-{run_id}-{i}" for i in range(args.services)]
+    submitted: Dict[int, float] = {}
+    running: Dict[int, float] = {}
+    latencies: List[float] = []
+    samples: List[int] = []
+    engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_size=1, max_overflow=0)
+    stop_sampling = asyncio.Event()
+    subscribed = asyncio.Event()
+
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=60) as client:
+        follower = asyncio.create_task(follow_running(client, running, subscribed))
+        sampler = asyncio.create_task(sample_db_connections(engine, args.sample_interval, samples, stop_sampling))
+        await asyncio.wait_for(subscribed.wait(), timeout=30)
+
+        started = time.perf_counter()
+        failures = await create_services(client, names, args.concurrency, submitted, latencies)
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline and not submitted.keys() <= running.keys():
+            await asyncio.sleep(0.2)
+        finished = time.perf_counter()
+
+        stop_sampling.set()
+        follower.cancel()
+        await asyncio.gather(follower, sampler, return_exceptions=True)
+    engine.dispose()
+
+    times_to_running = [running[id] - submitted[id] for id in submitted if id in running]
+    last_running = max((running[id] for id in submitted if id in running), default=finished)
+    duration = last_running - started
+    return {
+        "services_running": len(times_to_running),
+        "create_failures": failures,
+        "timed_out": len(submitted) - len(times_to_running),
+        "duration_seconds": duration,
+        "services_per_minute": len(times_to_running) / duration * 60 if duration > 0 else None,
+        "create_latency_seconds": common.summarize(latencies),
+        "time_to_running_seconds": common.summarize(times_to_running),
+        "db_connections": {
+            "peak": max(samples, default=None),
+            "mean": sum(samples) / len(samples) if samples else None,
+        },
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    log_dir = tempfile.mkdtemp(prefix="opencheiron-benchmark-")
+    moto_server, endpoint_url = common.start_moto_server()
+    ssh_server = SSHStandIn(command_delay=args.command_delay)
+    api_port = common.free_port()
+    env = {
+        **os.environ,
+        "AWS_ENDPOINT_URL": endpoint_url,
+        "SSH_PORT": str(ssh_server.port),
+        "BENCHMARK_SSH_HOST": "127.0.0.1",
+        "IMAGE_BAKING_ENABLED": "false",
+        "WARM_POOLS": "[]",
+        "WORKER_METRICS_PORT": "0",
+    }
+    processes = []
+    try:
+        processes.append(common.start_process(
+            [
+                sys.executable, "-m", "celery", "--app", "benchmarks.provisioning_worker.celery", "worker",
+                "--concurrency", str(args.worker_concurrency), "--loglevel", "warning", "--purge",
+                "--without-gossip", "--without-mingle",
+            ],
+            env, os.path.join(log_dir, "worker.log"),
+        ))
+        processes.append(common.start_process(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+            env, os.path.join(log_dir, "api.log"),
+        ))
+        common.wait_for_port(api_port)
+        wait_for_worker()
+        results = asyncio.run(drive(args, f"http://127.0.0.1:{api_port}"))
+    finally:
+        for process in processes:
+            common.stop_process(process)
+        ssh_server.close()
+        moto_server.stop()
+
+    parameters = {
+        key: getattr(args, key)
+        for key in ("services", "concurrency", "worker_concurrency", "command_delay", "timeout")
+    }
+    report = common.write_results(args.output, "provisioning", parameters, results)
+    print(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
+    print(f"Worker and API logs in {log_dir}")
+    if args.baseline:
+        print("\n".join(common.compare(report, args.baseline)))
+
+
+if __name__ == "__main__":
+    main()
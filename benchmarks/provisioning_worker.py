@@ -0,0 +1,25 @@
+"""Celery app of the provisioning benchmark.
+
+Instances launched on the EC2 stand-in report unroutable public addresses, every
+connection to the SSH port is sent to the SSH stand-in on this host instead.
+"""
+import os
+import socket
+
+from core.config import settings
+
+SSH_HOST = os.environ.get("BENCHMARK_SSH_HOST", "127.0.0.1")
+
+_create_connection = socket.create_connection
+
+
+def _create_local_connection(address, *args, **kwargs):
+    host, port = address[:2]
+    if port == settings.SSH_PORT:
+        address = (SSH_HOST, port)
+    return _create_connection(address, *args, **kwargs)
+
+
+socket.create_connection = _create_local_connection
+
+from worker import celery  # noqa: E402
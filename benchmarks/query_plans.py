@@ -0,0 +1,116 @@
+"""Query plan regression check of the hot lookups.
+
+Seeds the configured Postgres at scale, runs every hot lookup of `crud`, `BaseService`,
+the warm pools and the reconciler in a transaction that is rolled back, captures the
+SQL they send and asserts with `EXPLAIN` that none of it scans a whole table. Exits
+non-zero on a plan regression so it can gate the build.
+
+    python -m benchmarks.query_plans --services 100000
+"""
+import argparse
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from benchmarks.api_load import clean_up, seed
+from core import reconciler, warm_pool
+from core.config import WarmPool, settings
+from core.magic import NodeState, ServiceState
+from db.session import engine
+import crud
+
+# Most nodes of a long running installation are terminated, few are standby
+NODE_STATES = (NodeState.terminated,) * 47 + (NodeState.running, NodeState.pending, NodeState.standby)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=100000, help="services to seed")
+    parser.add_argument("--nodes-per-service", type=int, default=2)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    return parser.parse_args()
+
+
+def hot_lookups(prefix: str, service_id: int) -> Dict[str, Callable[[Session], object]]:
+    pool = WarmPool(size=1)
+    return {
+        "key pair of service": lambda session: crud.key_pair.get_by_service(db=session, service_id=service_id),
+        "completed launch steps": lambda session: crud.launch_checkpoint.completed_steps(db=session, service_id=service_id),
+        "launched nodes of service": lambda session: crud.node.get_launched(db=session, service_id=service_id),
+        "service by id": lambda session: crud.service.get(db=session, id=service_id),
+        "service page": lambda session: crud.service.get_page_filtered(db=session, cursor=service_id),
+        "service page by state": lambda session: crud.service.get_page_filtered(
+            db=session, cursor=service_id, state=ServiceState.initialized
+        ),
+        "service page by name prefix": lambda session: crud.service.get_page_filtered(
+            db=session, name_prefix=f"{prefix}-{service_id % 1000}"
+        ),
+        "warm pool standby count": lambda session: warm_pool.standby_count(session, pool),
+        "nodes to reconcile": lambda session: reconciler.diff_nodes(
+            session, reconciler.Observation(
+                instances={}, complete_regions=[], regions=settings.REGIONS, started_at=datetime.now(timezone.utc)
+            )
+        ),
+    }
+
+
+def capture_statements(lookup: Callable[[Session], object]) -> List[Tuple[str, object]]:
+    """SELECT statements the lookup sends, with their parameters, nothing it writes is kept."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        event.listen(connection, "before_cursor_execute", record)
+        try:
+            with Session(bind=connection, join_transaction_mode="create_savepoint") as session:
+                lookup(session)
+        finally:
+            event.remove(connection, "before_cursor_execute", record)
+            transaction.rollback()
+    return statements
+
+
+def sequential_scans(plan: dict) -> List[str]:
+    scans = []
+    if plan.get("Node Type") == "Seq Scan":
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans.extend(sequential_scans(child))
+    return scans
+
+
+def main() -> None:
+    args = parse_args()
+    prefix = f"plan-{uuid.uuid4().hex[:8]}"
+    service_ids = seed(prefix, args.services, args.nodes_per_service, node_states=NODE_STATES)
+    failures = []
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("ANALYZE services, nodes, key_pairs, launch_checkpoints"))
+            connection.commit()
+        sample_id = service_ids[len(service_ids) // 2]
+        for name, lookup in hot_lookups(prefix, sample_id).items():
+            for statement, parameters in capture_statements(lookup):
+                with engine.connect() as connection:
+                    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar_one()
+                scans = sequential_scans(plan[0]["Plan"])
+                print(f"{'FAIL' if scans else 'ok'}  {name}" + (f": sequential scan of {', '.join(scans)}" if scans else ""))
+                if scans:
+                    failures.append(name)
+    finally:
+        if not args.keep:
+            clean_up(prefix)
+    if failures:
+        sys.exit(f"{len(failures)} hot lookups are not served by an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""SSH server stand-in for the provisioning benchmarks.
+
+Kept apart from `benchmarks.common` so benchmarks of the API do not load paramiko.
+"""
+import socket
+import threading
+import time
+
+import paramiko
+
+
+class _AcceptAllServer(paramiko.ServerInterface):
+    def __init__(self, command_delay: float) -> None:
+        self.command_delay = command_delay
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        def run():
+            time.sleep(self.command_delay)
+            channel.send_exit_status(0)
+            channel.close()
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+
+class SSHStandIn:
+    """SSH server accepting any key, every command succeeds after `command_delay` seconds without running."""
+
+    def __init__(self, command_delay: float = 0) -> None:
+        self.command_delay = command_delay
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(512)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def _handle(self, client: socket.socket) -> None:
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        try:
+            transport.start_server(server=_AcceptAllServer(self.command_delay))
+        except (paramiko.SSHException, EOFError):
+            # Readiness probes only read the banner and hang up
+            transport.close()
+
+    def close(self) -> None:
+        self.sock.close()
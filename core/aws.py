@@ -0,0 +1,134 @@
+"""Per process cache of boto3 sessions, resources and clients.
+
+Creating a session loads the botocore service models and every client owns its own
+HTTPS connection pool, so both are created once per worker process and shared by
+all services launched in it. Clients are thread safe, resources are not: code that
+may run on several threads at once, like the launches of the provisioning engine,
+uses the client only.
+"""
+import threading
+from typing import Dict, Tuple
+
+import boto3
+from botocore.config import Config
+from celery.signals import worker_process_init
+from celery.utils.log import get_task_logger
+
+from core import metrics, rate_limit, tracing
+from core.config import settings
+import schemas
+
+logger = get_task_logger(__name__)
+
+CacheKey = Tuple[str, str, str]
+
+# Error codes AWS uses for throttled requests
+THROTTLING_ERROR_CODES = frozenset((
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottledException",
+    "RequestLimitExceeded", "RequestThrottled", "TooManyRequestsException",
+))
+
+_lock = threading.Lock()
+_sessions: Dict[CacheKey, boto3.session.Session] = {}
+_ec2_resources: Dict[CacheKey, object] = {}
+
+
+def _cache_key(aws_credentials: schemas.AWSCredentials) -> CacheKey:
+    return (aws_credentials.aws_access_key_id, aws_credentials.aws_secret_access_key, aws_credentials.region)
+
+
+def _client_config() -> Config:
+    return Config(
+        max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+    )
+
+
+def get_session(aws_credentials: schemas.AWSCredentials) -> boto3.session.Session:
+    key = _cache_key(aws_credentials)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            logger.info("Create boto3 session for region %s", aws_credentials.region)
+            session = boto3.session.Session(
+                aws_access_key_id=aws_credentials.aws_access_key_id,
+                aws_secret_access_key=aws_credentials.aws_secret_access_key,
+                region_name=aws_credentials.region,
+            )
+            _sessions[key] = session
+        return session
+
+
+def get_ec2_resource(aws_credentials: schemas.AWSCredentials):
+    """The cached resource, not for concurrent use by several threads."""
+    key = _cache_key(aws_credentials)
+    resource = _ec2_resources.get(key)
+    if resource is not None:
+        return resource
+    session = get_session(aws_credentials)
+    with _lock:
+        resource = _ec2_resources.get(key)
+        if resource is None:
+            logger.info("Create EC2 resource for region %s", aws_credentials.region)
+            resource = session.resource("ec2", config=_client_config(), endpoint_url=settings.AWS_ENDPOINT_URL)
+            _instrument(resource.meta.client, aws_credentials)
+            _ec2_resources[key] = resource
+        return resource
+
+
+def get_ec2_client(aws_credentials: schemas.AWSCredentials):
+    """The low level client of the cached resource, so both share one connection pool."""
+    return get_ec2_resource(aws_credentials).meta.client
+
+
+def _instrument(client, aws_credentials: schemas.AWSCredentials) -> None:
+    """Count every attempt of an API call and the throttled ones, botocore retries included.
+
+    Every attempt takes a token of the shared rate limiter, throttled ones back off its
+    rate. Every call, with all its attempts, is traced as one span.
+    """
+    service = client.meta.service_model.service_name
+    region = client.meta.region_name
+    account = aws_credentials.aws_access_key_id
+
+    def count_attempt(response, operation, **kwargs):
+        labels = dict(service=service, operation=operation.name, region=region)
+        metrics.BOTO3_CALLS.labels(**labels).inc()
+        if response is not None and response[1].get("Error", {}).get("Code") in THROTTLING_ERROR_CODES:
+            metrics.BOTO3_THROTTLES.labels(**labels).inc()
+            if settings.AWS_RATE_LIMIT_ENABLED:
+                rate_limit.throttled(account, region, operation.name)
+        # Leaves the retry decision to the other handlers
+
+    def wait_for_token(event_name, **kwargs):
+        rate_limit.acquire(account, region, event_name.rsplit(".", 1)[-1])
+        # Returning nothing lets botocore send the request
+
+    def start_call_span(model, context, **kwargs):
+        context["trace_span"] = tracing.start_span(f"aws {service} {model.name}", region=region)
+
+    def end_call_span(context, exception=None, parsed=None, **kwargs):
+        call_span = context.pop("trace_span", None)
+        if call_span is None:
+            return
+        error_code = (parsed or {}).get("Error", {}).get("Code")
+        if error_code is not None:
+            call_span.attributes["error_code"] = error_code
+            call_span.status = tracing.ERROR
+        tracing.end_span(call_span, exception)
+
+    event_service = client.meta.service_model.service_id.hyphenize()
+    client.meta.events.register(f"needs-retry.{event_service}", count_attempt)
+    if settings.AWS_RATE_LIMIT_ENABLED:
+        client.meta.events.register(f"before-send.{event_service}", wait_for_token)
+    client.meta.events.register(f"before-call.{event_service}", start_call_span)
+    client.meta.events.register(f"after-call.{event_service}", end_call_span)
+    client.meta.events.register(f"after-call-error.{event_service}", end_call_span)
+
+
+@worker_process_init.connect(weak=False)
+def clear_cache(**kwargs) -> None:
+    """Drop everything inherited from the parent, connections must not be shared across a fork."""
+    with _lock:
+        _sessions.clear()
+        _ec2_resources.clear()
@@ -1,6 +1,22 @@
-from typing import Dict, Any
+from typing import Dict, Any, List
 
-from pydantic import BaseSettings, PostgresDsn, RedisDsn, validator
+from pydantic import BaseModel, BaseSettings, PostgresDsn, RedisDsn, validator
+
+from core.magic import AWS_DEFAULT_AMI_ID, AWS_DEFAULT_REGION, AWSInstanceType
+
+
+class WarmPool(BaseModel):
+    """Standby nodes kept for launches with matching region, instance type and image.
+
+    `image_id` is the base image, launches with an image baked from it match the pool too.
+    """
+
+    region: str = AWS_DEFAULT_REGION
+    instance_type: AWSInstanceType = AWSInstanceType.t2_micro
+    image_id: str = AWS_DEFAULT_AMI_ID
+    size: int
+    keep_stopped: bool = True
+    """Stopped standby nodes cost only storage, running ones skip the boot on claim."""
 
 
 class Settings(BaseSettings):
@@ -9,16 +25,112 @@ class Settings(BaseSettings):
     # Celery
     CELERY_BROKER_URL: RedisDsn
 
+    LAUNCH_STEP_MAX_RETRIES: int = 5
+    # Regions whose launches run on the asyncio provisioning engine, see provisioner.py
+    PROVISIONING_ENGINE_REGIONS: List[str] = []
+    # Launches one engine process runs concurrently, threads for the blocking calls are added on top
+    PROVISIONING_ENGINE_MAX_LAUNCHES: int = 200
+    PROVISIONING_ENGINE_THREADS: int = 32
+    IMAGE_BAKE_TIMEOUT: float = 3600
+    IMAGE_BAKING_ENABLED: bool = True
+
     # SqlAlchemy
     POSTGRES_SERVER: str
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
     SQLALCHEMY_DATABASE_URI: PostgresDsn | None = None
+    ASYNC_SQLALCHEMY_DATABASE_URI: PostgresDsn | None = None
+    # Per process and engine, size these against max_connections of Postgres
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
 
     # boto3
     AWS_ACCESS_KEY_ID: str
     AWS_SECRET_ACCESS_KEY: str
+    AWS_MAX_POOL_CONNECTIONS: int = 50
+    # Regions services can be launched in, the first is the default. Each has its own worker queue.
+    REGIONS: List[str] = [AWS_DEFAULT_REGION]
+    # Base image of the nodes by region, AMI ids differ between regions
+    AMI_IDS: Dict[str, str] = {AWS_DEFAULT_REGION: AWS_DEFAULT_AMI_ID}
+    # Token buckets of the AWS API actions shared by all workers, in calls per second. A throttled
+    # action halves its rate, which recovers by AWS_RATE_RECOVERY calls per second every second.
+    AWS_RATE_LIMIT_ENABLED: bool = True
+    AWS_RATE_LIMIT_DEFAULT: float = 20
+    AWS_RATE_LIMITS: Dict[str, float] = {
+        "RunInstances": 2,
+        "StartInstances": 5,
+        "StopInstances": 5,
+        "TerminateInstances": 5,
+        "CreateKeyPair": 5,
+        "DeleteKeyPair": 5,
+        "CreateSecurityGroup": 5,
+        "AuthorizeSecurityGroupIngress": 5,
+        "CreateTags": 5,
+        "CreateImage": 5,
+    }
+    # Bucket size in seconds of the full rate
+    AWS_RATE_BURST_SECONDS: float = 5
+    AWS_RATE_RECOVERY: float = 0.5
+    # Another EC2 endpoint, e.g. a local moto server
+    AWS_ENDPOINT_URL: str | None = None
+
+    # Node readiness
+    NODE_READY_TIMEOUT: float = 600
+    SSH_PORT: int = 22
+
+    # SSH connection manager
+    SSH_CONNECT_TIMEOUT: float = 10
+    SSH_KEEPALIVE_INTERVAL: int = 30
+    SSH_IDLE_TIMEOUT: float = 300
+    SSH_COMMAND_TIMEOUT: float = 900
+    SSH_MAX_PARALLEL_NODES: int = 32
+
+    # Node reconciliation
+    RECONCILE_INTERVAL: float = 60
+    # Defaults to all REGIONS
+    RECONCILE_REGIONS: List[str] | None = None
+    # Upper bound of describe_instances calls per region and sweep
+    RECONCILE_MAX_PAGES: int = 10
+
+    # Warm pools, e.g. WARM_POOLS='[{"size": 5}]'
+    WARM_POOLS: List[WarmPool] = []
+    WARM_POOL_REFILL_INTERVAL: float = 60
+
+    # Seconds EC2 descriptions stay in the shared describe cache, by resource type
+    DESCRIBE_CACHE_TTLS: Dict[str, int] = {
+        "vpc": 3600,
+        "security_group": 300,
+        "image": 3600,
+    }
+
+    # Seconds between keepalive comments on idle state event streams
+    STATE_EVENTS_KEEPALIVE_INTERVAL: float = 15
+    # Seconds serialized service responses are cached, entries of outdated versions are never read
+    SERVICE_RESPONSE_CACHE_TTL: int = 5
+
+    # Prometheus, the worker exports the metrics of all its processes on this port, 0 disables it.
+    # Set PROMETHEUS_MULTIPROC_DIR to an empty directory for prefork workers.
+    WORKER_METRICS_PORT: int = 9808
+
+    # Tracing, one of tracing.EXPORTERS
+    TRACE_EXPORTER: str = "none"
+    TRACE_FILE: str = "traces.jsonl"
+
+    @validator("AMI_IDS")
+    def check_ami_ids(cls, v: Dict[str, str], values: Dict[str, Any]) -> Dict[str, str]:
+        missing = set(values.get("REGIONS", [])) - set(v)
+        if missing:
+            raise ValueError(f"no AMI id for the regions {', '.join(sorted(missing))}")
+        return v
+
+    @validator("RECONCILE_REGIONS", always=True)
+    def default_reconcile_regions(cls, v: List[str] | None, values: Dict[str, Any]) -> List[str]:
+        if v is None:
+            return values.get("REGIONS", [])
+        return v
 
     @validator("SQLALCHEMY_DATABASE_URI", pre=True)
     def assemble_db_connection(cls, v: str | None, values: Dict[str, Any]) -> Any:
@@ -32,5 +144,17 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
 
+    @validator("ASYNC_SQLALCHEMY_DATABASE_URI", pre=True)
+    def assemble_async_db_connection(cls, v: str | None, values: Dict[str, Any]) -> Any:
+        if isinstance(v, str):
+            return v
+        return PostgresDsn.build(
+            scheme="postgresql+asyncpg",
+            user=values.get("POSTGRES_USER"),
+            password=values.get("POSTGRES_PASSWORD"),
+            host=values.get("POSTGRES_SERVER"),
+            path=f"/{values.get('POSTGRES_DB') or ''}",
+        )
+
 
 settings = Settings()
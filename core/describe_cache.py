@@ -0,0 +1,89 @@
+"""Read-through cache of EC2 describe calls shared by all workers.
+
+Descriptions of slowly changing resources are kept in redis with a TTL per resource
+type, so concurrent launches do not each call the EC2 API for the same answer. Our own
+mutations invalidate the affected entries, empty results are never cached. Without redis
+every lookup goes to EC2.
+"""
+from typing import Callable, Optional
+
+import orjson
+from botocore.exceptions import ClientError
+from celery.utils.log import get_task_logger
+from redis import RedisError
+
+from core import metrics
+from core.config import settings
+from core.redis import get_redis
+import schemas
+
+logger = get_task_logger(__name__)
+
+VPC = "vpc"
+SECURITY_GROUP = "security_group"
+IMAGE = "image"
+
+HIT = "hit"
+MISS = "miss"
+
+
+class DescribeCache:
+    def __init__(self, ec2_client, aws_credentials: schemas.AWSCredentials) -> None:
+        self.ec2_client = ec2_client
+        self.namespace = f"opencheiron:describe:{aws_credentials.aws_access_key_id}:{aws_credentials.region}"
+
+    def vpc(self) -> Optional[dict]:
+        """The first VPC of the region, which is the default one."""
+        return self._get_or_load(VPC, "default", lambda: next(iter(self.ec2_client.describe_vpcs()["Vpcs"]), None))
+
+    def security_group(self, group_name: str) -> Optional[dict]:
+        def load():
+            response = self.ec2_client.describe_security_groups(
+                Filters=[dict(Name="group-name", Values=[group_name])]
+            )
+            return next(iter(response["SecurityGroups"]), None)
+
+        return self._get_or_load(SECURITY_GROUP, group_name, load)
+
+    def image(self, image_id: str) -> Optional[dict]:
+        def load():
+            try:
+                response = self.ec2_client.describe_images(ImageIds=[image_id])
+            except ClientError as e:
+                if e.response["Error"]["Code"] == "InvalidAMIID.NotFound":
+                    return None
+                raise
+            return next(iter(response["Images"]), None)
+
+        return self._get_or_load(IMAGE, image_id, load)
+
+    def invalidate(self, resource: str, key: str) -> None:
+        try:
+            get_redis().delete(self._key(resource, key))
+        except RedisError:
+            logger.warning("Could not invalidate cached %s %s", resource, key, exc_info=True)
+
+    def _key(self, resource: str, key: str) -> str:
+        return f"{self.namespace}:{resource}:{key}"
+
+    def _get_or_load(self, resource: str, key: str, load: Callable[[], Optional[object]]):
+        redis = get_redis()
+        cache_key = self._key(resource, key)
+        try:
+            cached = redis.get(cache_key)
+        except RedisError:
+            logger.warning("Describe cache unavailable, load %s %s from EC2", resource, key, exc_info=True)
+            return load()
+        if cached is not None:
+            metrics.DESCRIBE_CACHE_LOOKUPS.labels(resource=resource, outcome=HIT).inc()
+            return orjson.loads(cached)
+
+        metrics.DESCRIBE_CACHE_LOOKUPS.labels(resource=resource, outcome=MISS).inc()
+        value = load()
+        if value is not None:
+            try:
+                # Descriptions contain datetimes, orjson writes them as ISO strings
+                redis.set(cache_key, orjson.dumps(value), ex=settings.DESCRIBE_CACHE_TTLS[resource])
+            except RedisError:
+                logger.warning("Could not cache %s %s", resource, key, exc_info=True)
+        return value
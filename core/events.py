@@ -0,0 +1,102 @@
+"""State transitions of services and nodes published on redis pub/sub.
+
+Every service has its own channel, so subscribers interested in a single service
+only receive its events and everybody else subscribes to the channel pattern.
+Publishing is best effort, a lost event never fails a launch, the database stays
+the source of truth.
+
+Publishing also bumps the version of every affected service and of the service
+collection, readers use them to validate cached responses.
+"""
+import asyncio
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Iterable
+
+import orjson
+from celery.utils.log import get_task_logger
+from redis import RedisError
+
+from core.config import settings
+from core.redis import get_async_redis, get_redis
+
+logger = get_task_logger(__name__)
+
+SERVICE = "service"
+NODE = "node"
+
+VERSION = "version"
+
+
+def channel(service_id: int | str) -> str:
+    return f"opencheiron:state-events:{service_id}"
+
+
+def version_key(service_id: int | None = None) -> str:
+    """Hash with the version counter of one service, or of all without an id."""
+    if service_id is None:
+        return "opencheiron:service-version"
+    return f"opencheiron:service-version:{service_id}"
+
+
+@dataclass
+class StateEvent:
+    service_id: int
+    resource: str
+    """Either `SERVICE` or `NODE`."""
+    id: int
+    state: str
+
+    def encode(self) -> bytes:
+        return orjson.dumps(asdict(self))
+
+
+def _queue(pipeline, events: Iterable[StateEvent]) -> None:
+    events = list(events)
+    # Versions go first, a subscriber reading right after an event must not get a cached response
+    for service_id in {None, *(event.service_id for event in events)}:
+        pipeline.hincrby(version_key(service_id), VERSION)
+    for event in events:
+        pipeline.publish(channel(event.service_id), event.encode())
+
+
+def publish(events: Iterable[StateEvent]) -> None:
+    pipeline = get_redis().pipeline(transaction=False)
+    _queue(pipeline, events)
+    try:
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Could not publish state events", exc_info=True)
+
+
+async def apublish(events: Iterable[StateEvent]) -> None:
+    pipeline = get_async_redis().pipeline(transaction=False)
+    _queue(pipeline, events)
+    try:
+        await pipeline.execute()
+    except RedisError:
+        logger.warning("Could not publish state events", exc_info=True)
+
+
+async def stream(service_id: int | None = None) -> AsyncIterator[bytes | None]:
+    """Yield encoded events as they are published, `None` whenever the keepalive interval passed without one.
+
+    Without a service id the events of all services are streamed.
+    """
+    pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+    try:
+        if service_id is None:
+            await pubsub.psubscribe(channel("*"))
+        else:
+            await pubsub.subscribe(channel(service_id))
+        loop = asyncio.get_running_loop()
+        idle_since = loop.time()
+        while True:
+            message = await pubsub.get_message(timeout=settings.STATE_EVENTS_KEEPALIVE_INTERVAL)
+            if message is not None:
+                idle_since = loop.time()
+                yield message["data"]
+            elif loop.time() - idle_since >= settings.STATE_EVENTS_KEEPALIVE_INTERVAL:
+                idle_since = loop.time()
+                yield None
+    finally:
+        await pubsub.reset()
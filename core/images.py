@@ -0,0 +1,114 @@
+"""Golden machine images baked from the bootstrap recipe of a service.
+
+The recipe runs once as user data on a temporary instance which powers itself off when
+done, the stopped instance is then registered as an image. Images are cached per recipe
+hash and region, nodes launched from them skip the installation.
+"""
+import hashlib
+import time
+from typing import Sequence
+
+from botocore.exceptions import ClientError
+from celery.utils.log import get_task_logger
+
+from core import readiness
+from core.magic import AWSInstanceType
+
+logger = get_task_logger(__name__)
+
+IMAGE_TAG_KEY = "opencheiron:recipe-hash"
+
+
+def recipe_hash(recipe: Sequence[str], base_image_id: str) -> str:
+    digest = hashlib.sha256(base_image_id.encode())
+    for command in recipe:
+        digest.update(b"\0")
+        digest.update(command.encode())
+    return digest.hexdigest()
+
+
+def recipe_user_data(recipe: Sequence[str]) -> str:
+    commands = "\n".join(recipe)
+    # A failing command leaves the instance running, the bake then times out instead of registering a broken image
+    return f"#!/bin/bash\nset -euxo pipefail\n{commands}\nshutdown -h now\n"
+
+
+class ImageBaker:
+    def __init__(self, ec2_resource, ec2_client, *, timeout: float) -> None:
+        self.ec2_resource = ec2_resource
+        self.ec2_client = ec2_client
+        self.timeout = timeout
+
+    def bake(self, recipe: Sequence[str], *, base_image_id: str, instance_type: AWSInstanceType) -> str:
+        """Build and register an image for `recipe` within the timeout, returns the new image id."""
+        digest = recipe_hash(recipe, base_image_id)
+        tags = [{"Key": IMAGE_TAG_KEY, "Value": digest}]
+        logger.info("Bake image for recipe %s from %s", digest, base_image_id)
+        started = time.monotonic()
+
+        (instance,) = self.ec2_resource.create_instances(
+            ImageId=base_image_id,
+            MinCount=1,
+            MaxCount=1,
+            InstanceType=instance_type.value,
+            UserData=recipe_user_data(recipe),
+            InstanceInitiatedShutdownBehavior="stop",
+            TagSpecifications=[{"ResourceType": "instance", "Tags": tags}],
+        )
+        try:
+            self._wait_until_stopped(instance.id, timeout=self._remaining(started))
+            response = self.ec2_client.create_image(
+                InstanceId=instance.id,
+                Name=f"opencheiron-{digest[:32]}",
+                Description=f"opencheiron bootstrap recipe {digest}",
+                TagSpecifications=[{"ResourceType": "image", "Tags": tags}],
+            )
+            image_id = response["ImageId"]
+            try:
+                self._wait_until_available(image_id, timeout=self._remaining(started))
+            except Exception:
+                self._discard_image(image_id)
+                raise
+        finally:
+            self.ec2_client.terminate_instances(InstanceIds=[instance.id])
+        logger.info("Image %s for recipe %s baked in %.1fs", image_id, digest, time.monotonic() - started)
+        return image_id
+
+    def _discard_image(self, image_id: str) -> None:
+        """Deregister an image that never became available and delete its snapshots, a failed bake keeps nothing."""
+        logger.warning("Discard image %s of the failed bake", image_id)
+        try:
+            # CreateImage names the image in the description of the snapshots it takes
+            snapshots = self.ec2_client.describe_snapshots(
+                OwnerIds=["self"], Filters=[{"Name": "description", "Values": [f"*{image_id}*"]}]
+            )["Snapshots"]
+            self.ec2_client.deregister_image(ImageId=image_id)
+            for snapshot in snapshots:
+                self.ec2_client.delete_snapshot(SnapshotId=snapshot["SnapshotId"])
+        except ClientError:
+            logger.warning("Could not discard image %s", image_id, exc_info=True)
+
+    def _remaining(self, started: float) -> float:
+        return max(0.0, started + self.timeout - time.monotonic())
+
+    def _wait_until_stopped(self, instance_id: str, *, timeout: float) -> None:
+        def probe():
+            descriptions = readiness.describe_launched_instances(self.ec2_client, [instance_id])
+            if not descriptions:
+                return None
+            state = descriptions[instance_id]["State"]["Name"]
+            if state in ("shutting-down", "terminated"):
+                raise readiness.NodeNotReady(f"Bake instance {instance_id} terminated while running the recipe")
+            return True if state == "stopped" else None
+
+        readiness.poll(probe, timeout=timeout, description=f"bake instance {instance_id} to finish the recipe")
+
+    def _wait_until_available(self, image_id: str, *, timeout: float) -> None:
+        def probe():
+            response = self.ec2_client.describe_images(ImageIds=[image_id])
+            state = response["Images"][0]["State"] if response["Images"] else "pending"
+            if state in ("failed", "error", "invalid", "deregistered"):
+                raise RuntimeError(f"Image {image_id} ended in state {state}")
+            return True if state == "available" else None
+
+        readiness.poll(probe, timeout=timeout, description=f"image {image_id} to become available")
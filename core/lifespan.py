@@ -1,11 +1,18 @@
 from sqlalchemy import text
-from db.session import SessionLocal
+from db.base import Base
+from db.session import SessionLocal, engine
 
 
 class LifespanManager:
     @classmethod
     def startup(cls):
         cls._check_db_connection()
+        cls.create_schema()
+
+    @staticmethod
+    def create_schema():
+        """Create missing tables of all models, schema changes are applied with alembic."""
+        Base.metadata.create_all(bind=engine)
 
     def _check_db_connection():
         try:
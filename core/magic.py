@@ -16,6 +16,38 @@ class NodeState(enum.Enum):
     running = "running"
     """The node is running and ready for use."""
 
+    stopping = "stopping"
+    """The node is preparing to be stopped."""
+
+    stopped = "stopped"
+    """The node is shut down and cannot be used. The node can be started at any time."""
+
+    shutting_down = "shutting_down"
+    """The node is preparing to be terminated."""
+
+    terminated = "terminated"
+    """The node has been permanently deleted and cannot be started."""
+
+    standby = "standby"
+    """The node belongs to a warm pool, it is running or stopped and not yet attached to a service."""
+
+
+class LaunchStep(enum.Enum):
+    """Steps of a service launch in the order they complete, each one is checkpointed once done."""
+
+    key_pair = "key_pair"
+    security_group = "security_group"
+    nodes = "nodes"
+    bootstrap = "bootstrap"
+
+
+class ImageState(enum.Enum):
+    """A baked machine image is pending while it is built and available once it can be launched."""
+
+    pending = "pending"
+    available = "available"
+    failed = "failed"
+
 
 class AWSInstanceType(enum.Enum):
     """Instance types are named based on their family, generation, additional capabilities, and size.
@@ -35,6 +67,15 @@ AWS_DEFAULT_REGION = "us-west-2"
 #  ubuntu/images/hvm-ssd/ubuntu-jammy-22.04-amd64-server-20230516
 AWS_DEFAULT_AMI_ID = "ami-03f65b8614a860c29"
 AWS_DEFAULT_AMI_USERNAME = "ubuntu"
+# Every instance we launch is tagged with the id of its owning service
+AWS_SERVICE_TAG_KEY = "opencheiron:service-id"
+# Instances launched into a warm pool, they keep the tag after being claimed
+AWS_WARM_POOL_TAG_KEY = "opencheiron:warm-pool"
 AWS_SAMPLE_NODE_SCRIPT = """#!/bin/bash
 echo hi
 """
+
+SERVICE_PAGE_DEFAULT_LIMIT = 100
+SERVICE_PAGE_MAX_LIMIT = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+SERVICE_BULK_MAX_ITEMS = 1000
@@ -0,0 +1,125 @@
+"""Prometheus metrics of the API and the worker.
+
+The API renders them at `/metrics`. Prefork workers record into the directory named by
+`PROMETHEUS_MULTIPROC_DIR` and the main worker process serves the aggregate of all its
+children on `WORKER_METRICS_PORT`.
+"""
+import os
+from typing import Iterable, Tuple
+
+from celery.signals import worker_init, worker_process_shutdown
+from celery.utils.log import get_task_logger
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+    multiprocess, start_http_server,
+)
+
+from core.config import settings
+
+logger = get_task_logger(__name__)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "opencheiron_db_pool_checkout_seconds",
+    "Time spent waiting for a pooled database connection",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "opencheiron_db_pool_checked_out_connections",
+    "Database connections currently checked out of the pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CAPACITY = Gauge(
+    "opencheiron_db_pool_capacity_connections",
+    "Connections the pool may open, pool size plus overflow",
+    multiprocess_mode="livesum",
+)
+
+# Phases of `BaseService.launch`
+KEY_PAIR = "key_pair"
+SECURITY_GROUP = "security_group"
+RUN_INSTANCES = "run_instances"
+WAIT_UNTIL_RUNNING = "wait_until_running"
+SSH_CONNECT = "ssh_connect"
+BOOTSTRAP = "bootstrap"
+
+LAUNCH_PHASE_SECONDS = Histogram(
+    "opencheiron_launch_phase_seconds",
+    "Duration of each phase of a service launch",
+    ["phase"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200, float("inf")),
+)
+BOTO3_CALLS = Counter(
+    "opencheiron_boto3_calls",
+    "AWS API calls made through boto3, retries included",
+    ["service", "operation", "region"],
+)
+BOTO3_THROTTLES = Counter(
+    "opencheiron_boto3_throttles",
+    "AWS API calls that were throttled",
+    ["service", "operation", "region"],
+)
+AWS_RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "opencheiron_aws_rate_limit_wait_seconds",
+    "Time AWS API calls waited for a token of the shared rate limiter",
+    ["operation", "region"],
+    buckets=(0, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf")),
+)
+DESCRIBE_CACHE_LOOKUPS = Counter(
+    "opencheiron_describe_cache_lookups",
+    "Lookups of the shared EC2 describe cache by outcome, hit or miss",
+    ["resource", "outcome"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "opencheiron_http_request_seconds",
+    "Latency of the API routes until the response starts",
+    ["method", "route", "status"],
+)
+PROVISIONING_ENGINE_LAUNCHES = Gauge(
+    "opencheiron_provisioning_engine_launches",
+    "Launches running on the provisioning engine",
+    multiprocess_mode="livesum",
+)
+CELERY_QUEUE_DEPTH = Gauge(
+    "opencheiron_celery_queue_depth",
+    "Messages waiting in a celery queue",
+    ["queue"],
+    multiprocess_mode="livemax",
+)
+
+
+def launch_phase(phase: str):
+    """Times a launch phase, usable as context manager and as decorator."""
+    return LAUNCH_PHASE_SECONDS.labels(phase=phase).time()
+
+
+def _registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render() -> Tuple[bytes, str]:
+    """The current metrics of this process, or of all processes sharing the multiprocess directory."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def set_queue_depths(depths: Iterable[Tuple[str, int]]) -> None:
+    for queue, depth in depths:
+        CELERY_QUEUE_DEPTH.labels(queue=queue).set(depth)
+
+
+@worker_init.connect(weak=False)
+def start_worker_exporter(**kwargs) -> None:
+    if not settings.WORKER_METRICS_PORT:
+        return
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        logger.warning("PROMETHEUS_MULTIPROC_DIR is not set, only metrics of the main worker process are exported")
+    start_http_server(settings.WORKER_METRICS_PORT, registry=_registry())
+    logger.info("Export worker metrics on port %s", settings.WORKER_METRICS_PORT)
+
+
+@worker_process_shutdown.connect(weak=False)
+def mark_process_dead(pid: int, **kwargs) -> None:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,119 @@
+"""Asyncio provisioning engine running many service launches in one process.
+
+A prefork worker slot is blocked for a whole launch step, mostly waiting for instances
+to run and for SSH to come up. The engine runs launches as coroutines instead: it waits
+for the nodes on the event loop and hands the short blocking boto3, database and SSH
+calls as well as the `on_ssh_connection` hook to threads. Steps keep their checkpoints
+and are retried like `launch_step_task`, so a launch can be resumed by either.
+"""
+import asyncio
+import itertools
+import random
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Set
+
+from celery.utils.log import get_task_logger
+
+from core import metrics, tasks, tracing
+from core.config import settings
+from core.magic import LaunchStep
+from core.services import build_service
+from core.services.factory import bake_wanted
+from db.unit_of_work import UnitOfWork
+
+logger = get_task_logger(__name__)
+
+# The steps of a stage do not depend on each other and run concurrently, like the celery workflow
+STAGES = ((LaunchStep.key_pair, LaunchStep.security_group), (LaunchStep.nodes,), (LaunchStep.bootstrap,))
+# Upper bound of the retry delay, the default of celery's retry_backoff_max
+MAX_RETRY_DELAY = 600
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[UnitOfWork]:
+    """A `UnitOfWork` whose commit or rollback on leaving runs on a thread."""
+    uow = UnitOfWork().__enter__()
+    try:
+        yield uow
+    except BaseException as e:
+        await asyncio.to_thread(uow.__exit__, type(e), e, e.__traceback__)
+        raise
+    await asyncio.to_thread(uow.__exit__, None, None, None)
+
+
+def _build_service(uow: UnitOfWork, service_id: int):
+    service = build_service(uow, service_id)
+    # See BaseService._in_thread, no connection is held while waiting for a thread
+    uow.release()
+    return service
+
+
+def _dispatch_bake(region: str) -> None:
+    with UnitOfWork() as uow:
+        wanted = bake_wanted(uow.session, region)
+    if wanted:
+        # Later launches use the baked image, this one installs over SSH meanwhile
+        tasks.bake_image(region).delay()
+
+
+class ProvisioningEngine:
+    def __init__(self, *, max_launches: int) -> None:
+        self._slots = asyncio.Semaphore(max_launches)
+        self._launches: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> int:
+        return len(self._launches)
+
+    def submit(self, service_id: int, region: str, parent: tracing.SpanContext | None = None) -> asyncio.Task:
+        """Start the launch of a service, it waits for a free slot once more than `max_launches` run."""
+        task = asyncio.get_running_loop().create_task(self.launch(service_id, region, parent))
+        self._launches.add(task)
+        task.add_done_callback(self._launches.discard)
+        return task
+
+    async def join(self) -> None:
+        """Wait until all submitted launches finished."""
+        while self._launches:
+            await asyncio.wait(set(self._launches))
+
+    async def launch(self, service_id: int, region: str, parent: tracing.SpanContext | None = None) -> bool:
+        """Run the launch steps of the service, returns whether all of them completed."""
+        async with self._slots:
+            metrics.PROVISIONING_ENGINE_LAUNCHES.inc()
+            try:
+                with tracing.span("engine launch", parent, service_id=service_id, region=region):
+                    if settings.IMAGE_BAKING_ENABLED:
+                        await asyncio.to_thread(_dispatch_bake, region)
+                    for stage in STAGES:
+                        results = await asyncio.gather(
+                            *(self.run_step(service_id, step) for step in stage), return_exceptions=True
+                        )
+                        for result in results:
+                            if isinstance(result, BaseException):
+                                raise result
+            except Exception:
+                logger.exception("Launch of service %s failed", service_id)
+                return False
+            finally:
+                metrics.PROVISIONING_ENGINE_LAUNCHES.dec()
+        return True
+
+    @staticmethod
+    async def run_step(service_id: int, step: LaunchStep) -> None:
+        """Run a launch step with a unit of work per attempt, failed attempts are retried with backoff."""
+        for retries in itertools.count():
+            try:
+                async with unit_of_work() as uow:
+                    service = await asyncio.to_thread(_build_service, uow, service_id)
+                    await service.arun_step(step)
+                return
+            except Exception:
+                if retries >= settings.LAUNCH_STEP_MAX_RETRIES:
+                    raise
+                # Exponential backoff with full jitter, as celery's retry_backoff
+                delay = random.randrange(min(MAX_RETRY_DELAY, 2 ** retries) + 1)
+                logger.warning(
+                    "Launch step %s of service %s failed, retry in %ss", step.value, service_id, delay, exc_info=True
+                )
+                await asyncio.sleep(delay)
@@ -0,0 +1,112 @@
+"""Token buckets of AWS API actions shared by all workers.
+
+EC2 throttles per account, region and action, so concurrent launches draw their calls
+from one bucket per action in redis instead of each hitting RequestLimitExceeded and
+retrying on its own. A caller takes a token and waits until its turn if the bucket is
+empty, the wait is fair because tokens are reserved in order. A throttled action
+halves its rate, which recovers linearly afterwards, so the rate settles near the
+highest one the API sustains. Without redis calls are not limited.
+"""
+import time
+from functools import lru_cache
+from typing import Tuple
+
+from celery.utils.log import get_task_logger
+from redis import RedisError
+from redis.commands.core import Script
+
+from core import metrics
+from core.config import settings
+from core.redis import get_redis
+
+logger = get_task_logger(__name__)
+
+# Throttled actions multiply their rate by this factor, but keep at least the minimum fraction
+BACKOFF_FACTOR = 0.5
+MIN_RATE_FRACTION = 1 / 64
+
+# Returns the milliseconds until the reserved token is available
+ACQUIRE = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local max_rate, burst, recovery, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'rate', 'updated')
+local tokens = tonumber(state[1]) or burst
+local rate = tonumber(state[2]) or max_rate
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+rate = math.min(max_rate, rate + recovery * elapsed)
+tokens = math.min(burst, tokens + rate * elapsed) - 1
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'rate', rate, 'updated', now)
+redis.call('EXPIRE', KEYS[1], ttl)
+if tokens >= 0 then
+    return 0
+end
+return math.ceil(-tokens / rate * 1000)
+"""
+
+# Backs off the rate and drops the tokens the throttled callers were counting on
+THROTTLE = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local max_rate, factor, min_rate, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'rate')
+local rate = math.max(min_rate, (tonumber(state[2]) or max_rate) * factor)
+local tokens = math.min(0, tonumber(state[1]) or 0)
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'rate', rate, 'updated', now)
+redis.call('EXPIRE', KEYS[1], ttl)
+return tostring(rate)
+"""
+
+
+def bucket_key(account: str, region: str, operation: str) -> str:
+    return f"opencheiron:rate-limit:{account}:{region}:{operation}"
+
+
+def max_rate(operation: str) -> float:
+    """Calls per second of the action when it is not throttled."""
+    return settings.AWS_RATE_LIMITS.get(operation, settings.AWS_RATE_LIMIT_DEFAULT)
+
+
+@lru_cache
+def _scripts() -> Tuple[Script, Script]:
+    redis = get_redis()
+    return redis.register_script(ACQUIRE), redis.register_script(THROTTLE)
+
+
+def _ttl(rate: float) -> int:
+    # Long enough for a backed off rate to recover completely
+    return int(rate / settings.AWS_RATE_RECOVERY) + 60
+
+
+def acquire(account: str, region: str, operation: str) -> float:
+    """Take a token of the action, waiting for it if necessary, returns the seconds waited."""
+    rate = max_rate(operation)
+    acquire_script, _ = _scripts()
+    try:
+        wait_ms = acquire_script(
+            keys=[bucket_key(account, region, operation)],
+            args=[rate, max(1.0, rate * settings.AWS_RATE_BURST_SECONDS), settings.AWS_RATE_RECOVERY, _ttl(rate)],
+        )
+    except RedisError:
+        logger.warning("Rate limiter unavailable, call %s without limit", operation, exc_info=True)
+        return 0
+    waited = wait_ms / 1000
+    if waited:
+        time.sleep(waited)
+    metrics.AWS_RATE_LIMIT_WAIT_SECONDS.labels(operation=operation, region=region).observe(waited)
+    return waited
+
+
+def throttled(account: str, region: str, operation: str) -> None:
+    """Back off the rate of the action after AWS throttled a call."""
+    rate = max_rate(operation)
+    _, throttle_script = _scripts()
+    try:
+        backed_off = float(throttle_script(
+            keys=[bucket_key(account, region, operation)],
+            args=[rate, BACKOFF_FACTOR, rate * MIN_RATE_FRACTION, _ttl(rate)],
+        ))
+    except RedisError:
+        logger.warning("Rate limiter unavailable, could not back off %s", operation, exc_info=True)
+        return
+    logger.info("%s throttled in %s, back off to %.2f calls per second", operation, region, backed_off)
@@ -0,0 +1,247 @@
+"""Readiness checks for freshly launched nodes.
+
+A node is ready once EC2 reports it running, its SSH port accepts TCP connections
+and the SSH daemon sends its identification banner. Every check polls with
+exponential backoff and returns as soon as it succeeds. The checks prefixed with `a`
+are their asyncio counterparts, which wait without holding a thread.
+"""
+import asyncio
+import socket
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterator, TypeVar
+
+from botocore.exceptions import ClientError
+from celery.utils.log import get_task_logger
+
+logger = get_task_logger(__name__)
+
+T = TypeVar("T")
+
+INITIAL_DELAY = 0.5
+MAX_DELAY = 5.0
+BACKOFF_FACTOR = 1.5
+SOCKET_TIMEOUT = 3.0
+SSH_BANNER_PREFIX = b"SSH-"
+
+
+class NodeNotReady(RuntimeError):
+    pass
+
+
+@dataclass
+class ReadinessTimings:
+    """Seconds spent in each readiness phase."""
+
+    instance_running: float = 0.0
+    tcp_reachable: float = 0.0
+    ssh_banner: float = 0.0
+
+    @property
+    def total(self) -> float:
+        return self.instance_running + self.tcp_reachable + self.ssh_banner
+
+
+def backoff_delays(initial: float = INITIAL_DELAY, maximum: float = MAX_DELAY, factor: float = BACKOFF_FACTOR) -> Iterator[float]:
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * factor, maximum)
+
+
+def poll(probe: Callable[[], T | None], *, timeout: float, description: str) -> T:
+    """Call `probe` until it returns something other than None or `timeout` seconds passed."""
+    deadline = time.monotonic() + timeout
+    for delay in backoff_delays():
+        result = probe()
+        if result is not None:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise NodeNotReady(f"Timed out after {timeout}s waiting for {description}")
+        time.sleep(min(delay, remaining))
+
+
+async def apoll(probe: Callable[[], Awaitable[T | None]], *, timeout: float, description: str) -> T:
+    deadline = time.monotonic() + timeout
+    for delay in backoff_delays():
+        result = await probe()
+        if result is not None:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise NodeNotReady(f"Timed out after {timeout}s waiting for {description}")
+        await asyncio.sleep(min(delay, remaining))
+
+
+def describe_launched_instances(ec2_client, instance_ids: list[str]) -> dict[str, dict] | None:
+    """Descriptions of instances by id, None while EC2 does not know the just launched instances yet."""
+    try:
+        response = ec2_client.describe_instances(InstanceIds=instance_ids)
+    except ClientError as e:
+        # describe_instances is eventually consistent, it may not see instances right after RunInstances
+        if e.response["Error"]["Code"] == "InvalidInstanceID.NotFound":
+            logger.debug("Instances %s are not known yet", instance_ids)
+            return None
+        raise
+    return {
+        instance["InstanceId"]: instance
+        for reservation in response["Reservations"]
+        for instance in reservation["Instances"]
+    }
+
+
+def _running_probe(ec2_client, instance_ids: list[str], starting: bool) -> Callable[[], dict[str, dict] | None]:
+    failed_states = ("shutting-down", "terminated") if starting else ("shutting-down", "terminated", "stopping", "stopped")
+
+    def probe():
+        descriptions = describe_launched_instances(ec2_client, instance_ids)
+        if descriptions is None:
+            return None
+        states = {instance_id: description["State"]["Name"] for instance_id, description in descriptions.items()}
+        failed = [instance_id for instance_id, state in states.items() if state in failed_states]
+        if failed:
+            raise NodeNotReady(f"Instances {failed} stopped before reaching the running state")
+        if len(states) == len(instance_ids) and all(state == "running" for state in states.values()):
+            return descriptions
+        logger.debug("Waiting for instances to run %s", states)
+        return None
+
+    return probe
+
+
+def wait_until_running(ec2_client, instance_ids: list[str], *, timeout: float, starting: bool = False) -> dict[str, dict]:
+    """Poll `describe_instances` until all instances are running, returns their descriptions by id.
+
+    With `starting` stopped instances are expected to come up, they may still report
+    their old state right after being started.
+    """
+    probe = _running_probe(ec2_client, instance_ids, starting)
+    return poll(probe, timeout=timeout, description=f"instances {instance_ids} to run")
+
+
+async def await_until_running(ec2_client, instance_ids: list[str], *, timeout: float, starting: bool = False) -> dict[str, dict]:
+    # boto3 blocks, only the describe call itself runs on a thread
+    probe = _running_probe(ec2_client, instance_ids, starting)
+    return await apoll(
+        lambda: asyncio.to_thread(probe), timeout=timeout, description=f"instances {instance_ids} to run"
+    )
+
+
+def wait_until_stopped(ec2_client, instance_ids: list[str], *, timeout: float) -> dict[str, dict]:
+    """Poll `describe_instances` until all instances are stopped, returns their descriptions by id."""
+    def probe():
+        descriptions = describe_launched_instances(ec2_client, instance_ids)
+        if descriptions is None:
+            return None
+        states = {instance_id: description["State"]["Name"] for instance_id, description in descriptions.items()}
+        failed = [instance_id for instance_id, state in states.items() if state in ("shutting-down", "terminated")]
+        if failed:
+            raise NodeNotReady(f"Instances {failed} terminated before reaching the stopped state")
+        if len(states) == len(instance_ids) and all(state == "stopped" for state in states.values()):
+            return descriptions
+        logger.debug("Waiting for instances to stop %s", states)
+        return None
+
+    return poll(probe, timeout=timeout, description=f"instances {instance_ids} to stop")
+
+
+def _connect(host: str, port: int) -> socket.socket | None:
+    try:
+        return socket.create_connection((host, port), timeout=SOCKET_TIMEOUT)
+    except OSError:
+        return None
+
+
+def wait_for_port(host: str, port: int, *, timeout: float) -> None:
+    def probe():
+        connection = _connect(host, port)
+        if connection is None:
+            return None
+        connection.close()
+        return True
+
+    poll(probe, timeout=timeout, description=f"{host}:{port} to accept connections")
+
+
+def wait_for_ssh_banner(host: str, port: int, *, timeout: float) -> bytes:
+    """Wait until the SSH daemon identifies itself, a listening port alone may still drop the connection."""
+
+    def probe():
+        connection = _connect(host, port)
+        if connection is None:
+            return None
+        try:
+            banner = connection.recv(256)
+        except OSError:
+            return None
+        finally:
+            connection.close()
+        return banner if banner.startswith(SSH_BANNER_PREFIX) else None
+
+    return poll(probe, timeout=timeout, description=f"SSH banner of {host}:{port}")
+
+
+def wait_until_reachable(host: str, port: int, *, timeout: float, timings: ReadinessTimings) -> None:
+    started = time.monotonic()
+    wait_for_port(host, port, timeout=timeout)
+    timings.tcp_reachable = time.monotonic() - started
+
+    started = time.monotonic()
+    banner = wait_for_ssh_banner(host, port, timeout=max(timeout - timings.tcp_reachable, SOCKET_TIMEOUT))
+    timings.ssh_banner = time.monotonic() - started
+    logger.info("%s:%s is reachable, banner %s", host, port, banner.strip())
+
+
+async def _aconnect(host: str, port: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter] | None:
+    try:
+        return await asyncio.wait_for(asyncio.open_connection(host, port), SOCKET_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return None
+
+
+async def _aclose(writer: asyncio.StreamWriter) -> None:
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+
+async def await_for_port(host: str, port: int, *, timeout: float) -> None:
+    async def probe():
+        connection = await _aconnect(host, port)
+        if connection is None:
+            return None
+        await _aclose(connection[1])
+        return True
+
+    await apoll(probe, timeout=timeout, description=f"{host}:{port} to accept connections")
+
+
+async def await_for_ssh_banner(host: str, port: int, *, timeout: float) -> bytes:
+    async def probe():
+        connection = await _aconnect(host, port)
+        if connection is None:
+            return None
+        reader, writer = connection
+        try:
+            banner = await asyncio.wait_for(reader.read(256), SOCKET_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        finally:
+            await _aclose(writer)
+        return banner if banner.startswith(SSH_BANNER_PREFIX) else None
+
+    return await apoll(probe, timeout=timeout, description=f"SSH banner of {host}:{port}")
+
+
+async def await_until_reachable(host: str, port: int, *, timeout: float, timings: ReadinessTimings) -> None:
+    started = time.monotonic()
+    await await_for_port(host, port, timeout=timeout)
+    timings.tcp_reachable = time.monotonic() - started
+
+    started = time.monotonic()
+    banner = await await_for_ssh_banner(host, port, timeout=max(timeout - timings.tcp_reachable, SOCKET_TIMEOUT))
+    timings.ssh_banner = time.monotonic() - started
+    logger.info("%s:%s is reachable, banner %s", host, port, banner.strip())
@@ -0,0 +1,163 @@
+"""Keeps the nodes table in sync with the instances EC2 reports.
+
+One sweep pages through `describe_instances` for every tagged instance of a region,
+diffs the result against the stored nodes and applies all changes as one bulk update.
+Only nodes of the swept regions that existed when the sweep started are diffed, and a
+node is marked terminated once it was missing from consecutive complete sweeps.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List
+
+from celery.utils.log import get_task_logger
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from core import aws, events
+from core.magic import AWS_SERVICE_TAG_KEY, AWS_WARM_POOL_TAG_KEY, NodeState
+from db.unit_of_work import UnitOfWork
+import models
+import schemas
+
+logger = get_task_logger(__name__)
+
+# Largest page describe_instances accepts
+DESCRIBE_PAGE_SIZE = 1000
+# Complete sweeps a node has to be missing from before it counts as terminated
+MISSED_SWEEPS_TO_TERMINATE = 2
+
+EC2_NODE_STATES = {
+    "pending": NodeState.pending,
+    "running": NodeState.running,
+    "stopping": NodeState.stopping,
+    "stopped": NodeState.stopped,
+    "shutting-down": NodeState.shutting_down,
+    "terminated": NodeState.terminated,
+}
+
+
+@dataclass
+class ObservedInstance:
+    state: NodeState
+    public_ip_address: str | None
+
+
+@dataclass
+class Observation:
+    instances: Dict[str, ObservedInstance]
+    complete_regions: List[str]
+    """Regions whose last page was read before the page budget ran out."""
+    regions: List[str]
+    """Regions that were swept, nodes of other regions are not diffed."""
+    started_at: datetime
+    """Database time the sweep started, nodes created later may be missing from it."""
+
+
+def describe_tagged_instances(ec2_client, region: str, *, max_pages: int, started_at: datetime) -> Observation:
+    paginator = ec2_client.get_paginator("describe_instances")
+    pages = paginator.paginate(
+        Filters=[{"Name": "tag-key", "Values": [AWS_SERVICE_TAG_KEY, AWS_WARM_POOL_TAG_KEY]}],
+        PaginationConfig={"PageSize": DESCRIBE_PAGE_SIZE},
+    )
+    instances = {}
+    complete = True
+    for page_number, page in enumerate(pages, start=1):
+        for reservation in page["Reservations"]:
+            for instance in reservation["Instances"]:
+                instances[instance["InstanceId"]] = ObservedInstance(
+                    state=EC2_NODE_STATES[instance["State"]["Name"]],
+                    public_ip_address=instance.get("PublicIpAddress"),
+                )
+        if page_number >= max_pages and page.get("NextToken"):
+            complete = False
+            break
+    return Observation(
+        instances=instances, complete_regions=[region] if complete else [], regions=[region], started_at=started_at
+    )
+
+
+def diff_nodes(session: Session, observation: Observation) -> List[dict]:
+    """Changes that bring the stored nodes in line with the observation, keyed by node id."""
+    known_nodes = session.execute(
+        select(
+            models.Node.id, models.Node.instance_id, models.Node.state, models.Node.public_ip_address,
+            models.Node.missed_sweeps, models.Node.region,
+        )
+        .where(
+            models.Node.instance_id.is_not(None),
+            models.Node.state != NodeState.terminated,
+            models.Node.region.in_(observation.regions),
+            models.Node.created_at < observation.started_at,
+        )
+    ).all()
+    changes = []
+    for node_id, instance_id, state, public_ip_address, missed_sweeps, region in known_nodes:
+        observed = observation.instances.get(instance_id)
+        if observed is None:
+            # EC2 forgets terminated instances after a while, only trust absence after a full sweep of its region.
+            # describe_instances is eventually consistent, a single absence may be a lagging view.
+            if region in observation.complete_regions:
+                missed_sweeps += 1
+                if missed_sweeps >= MISSED_SWEEPS_TO_TERMINATE:
+                    changes.append({"id": node_id, "state": NodeState.terminated, "missed_sweeps": missed_sweeps})
+                else:
+                    changes.append({"id": node_id, "missed_sweeps": missed_sweeps})
+            continue
+        observed_state = observed.state
+        # Standby nodes are running or stopped by design, only their loss changes the state
+        if state == NodeState.standby and observed_state not in (NodeState.shutting_down, NodeState.terminated):
+            observed_state = NodeState.standby
+        if observed_state != state or observed.public_ip_address != public_ip_address or missed_sweeps:
+            changes.append({
+                "id": node_id,
+                "state": observed_state,
+                "public_ip_address": observed.public_ip_address,
+                "missed_sweeps": 0,
+            })
+    return changes
+
+
+def apply_changes(session: Session, changes: List[dict]) -> None:
+    if changes:
+        session.execute(update(models.Node), changes)
+
+
+def state_events(session: Session, changes: List[dict]) -> List[events.StateEvent]:
+    """State events of the changed nodes that belong to a service."""
+    states = {change["id"]: change["state"] for change in changes if "state" in change}
+    if not states:
+        return []
+    owners = session.execute(
+        select(models.Node.id, models.Node.service_id)
+        .where(models.Node.id.in_(states), models.Node.service_id.is_not(None))
+    ).all()
+    return [
+        events.StateEvent(service_id=service_id, resource=events.NODE, id=node_id, state=states[node_id].value)
+        for node_id, service_id in owners
+    ]
+
+
+def reconcile(uow: UnitOfWork, regions: List[str], *, max_pages: int) -> int:
+    """Sweep all regions and write the differences in the unit of work, returns the number of changed nodes.
+
+    The state transitions are published once the unit of work committed.
+    """
+    session = uow.session
+    # Database time, as the creation times of the nodes it is compared with
+    started_at = session.scalar(select(func.now()))
+    observation = Observation(instances={}, complete_regions=[], regions=regions, started_at=started_at)
+    for region in regions:
+        ec2_client = aws.get_ec2_client(schemas.AWSCredentials.from_settings(region=region))
+        region_observation = describe_tagged_instances(ec2_client, region, max_pages=max_pages, started_at=started_at)
+        if not region_observation.complete_regions:
+            logger.warning("Page budget exhausted for region %s, sweep is partial", region)
+        observation.instances.update(region_observation.instances)
+        observation.complete_regions.extend(region_observation.complete_regions)
+
+    changes = diff_nodes(session, observation)
+    apply_changes(session, changes)
+    node_events = state_events(session, changes)
+    if node_events:
+        uow.after_commit(lambda: events.publish(node_events))
+    logger.info("Reconciled %s instances, %s nodes changed", len(observation.instances), len(changes))
+    return len(changes)
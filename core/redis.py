@@ -0,0 +1,17 @@
+"""Shared clients of the redis instance that also serves as celery broker."""
+from functools import lru_cache
+
+import redis
+from redis import asyncio as aioredis
+
+from core.config import settings
+
+
+@lru_cache
+def get_redis() -> redis.Redis:
+    return redis.Redis.from_url(settings.CELERY_BROKER_URL)
+
+
+@lru_cache
+def get_async_redis() -> aioredis.Redis:
+    return aioredis.Redis.from_url(settings.CELERY_BROKER_URL)
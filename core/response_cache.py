@@ -0,0 +1,109 @@
+"""Conditional requests and a short lived cache of serialized service responses.
+
+Both are driven by validators made of the service versions bumped with every published
+state event, see `core.events`, and the modification time of the service rows. Publishing
+is best effort, the modification time changes with the committed write even if its
+version bump was lost, so neither alone answers with a stale copy. Cache entries are
+keyed by the validator they were built at, so a state change makes them unreachable
+right away and the TTL only bounds memory. Without redis every read goes to the database.
+"""
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional
+
+from celery.utils.log import get_task_logger
+from fastapi import Request
+from redis import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import events
+from core.config import settings
+from core.redis import get_async_redis
+import crud
+
+logger = get_task_logger(__name__)
+
+BODY = b"body"
+
+
+@dataclass
+class Validator:
+    version: int
+    modified: float
+    """Database time of the last change, with microsecond precision."""
+
+    @property
+    def etag(self) -> str:
+        # The modification time also tells apart versions counted again after the hash was lost
+        return f'W/"{self.version}.{int(self.modified * 1_000_000)}"'
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "ETag": self.etag,
+            "Cache-Control": "no-cache",
+            "Last-Modified": formatdate(self.modified, usegmt=True),
+        }
+
+    def not_modified(self, request: Request) -> bool:
+        """Whether the client's copy is current, `If-None-Match` takes precedence over `If-Modified-Since`."""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return self.etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*"
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have second precision
+        return int(self.modified) <= since
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+async def get_validator(db: AsyncSession, service_id: int | None = None) -> Optional[Validator]:
+    """Validator of one service, or of the service collection without an id.
+
+    None if the service does not exist or redis is unavailable, the read is not conditional then.
+    """
+    try:
+        version = await get_async_redis().hget(events.version_key(service_id), events.VERSION)
+    except RedisError:
+        logger.warning("Could not read service version", exc_info=True)
+        return None
+    updated_at = await crud.service.aget_updated_at(db=db, id=service_id)
+    if updated_at is None:
+        return None
+    return Validator(version=int(version or 0), modified=updated_at.timestamp())
+
+
+def cache_key(validator: Validator, path: str, query: str = "") -> str:
+    return f"opencheiron:service-response:{validator.etag}:{path}?{query}"
+
+
+async def load(key: str) -> Optional[CachedResponse]:
+    try:
+        cached = await get_async_redis().hgetall(key)
+    except RedisError:
+        logger.warning("Could not read cached response", exc_info=True)
+        return None
+    if BODY not in cached:
+        return None
+    body = cached.pop(BODY)
+    return CachedResponse(body=body, headers={name.decode(): value.decode() for name, value in cached.items()})
+
+
+async def store(key: str, response: CachedResponse) -> None:
+    pipeline = get_async_redis().pipeline(transaction=False)
+    pipeline.hset(key, mapping={BODY: response.body, **response.headers})
+    pipeline.expire(key, settings.SERVICE_RESPONSE_CACHE_TTL)
+    try:
+        await pipeline.execute()
+    except RedisError:
+        logger.warning("Could not cache response", exc_info=True)
@@ -1,2 +1,3 @@
 from .base import BaseService
 from .pg import PGService
+from .factory import build_service
@@ -1,126 +1,356 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import enum
 from functools import cached_property
-from io import StringIO
 import time
-import boto3
+from typing import Callable, TypeVar
 from celery.utils.log import get_task_logger
-import paramiko
 from abc import ABC, abstractmethod
 
-from core.magic import NodeState, ServiceState
-from db.session import SessionLocal
+from botocore.exceptions import ClientError
+from sqlalchemy import insert
+
+from core import aws, describe_cache, events, metrics, readiness, ssh, tracing, warm_pool
+from core.config import settings
+from core.magic import AWS_DEFAULT_AMI_USERNAME, AWS_SERVICE_TAG_KEY, LaunchStep, NodeState, ServiceState
+from db.unit_of_work import UnitOfWork
 import crud
 import models
 import schemas
 
 logger = get_task_logger(__name__)
 
+T = TypeVar("T")
+
 
 class BaseService(ABC):
-    def __init__(self, aws_credentials: schemas.AWSCredentials, node_config: schemas.NodeConfig, service_config: schemas.ServiceConfig) -> None:
+    bootstrap_recipe: tuple[str, ...] = ()
+    """Shell commands installing the service on a node, baked into the image when cached."""
+
+    def __init__(self, aws_credentials: schemas.AWSCredentials, node_config: schemas.NodeConfig, service_config: schemas.ServiceConfig, uow: UnitOfWork) -> None:
+        self.uow = uow
         self.aws_credentials = aws_credentials
         self.node_config = node_config
         self.service_config = service_config
-        self.ec2_resource = self._get_ec2_resource(aws_credentials)
         self.ec2_client = self._get_ec2_client(aws_credentials)
-
-    @staticmethod
-    def _get_ec2_resource(aws_credentials: schemas.AWSCredentials):
-        logger.info("Get EC2 resource")
-        return boto3.resource(
-            "ec2",
-            aws_access_key_id=aws_credentials.aws_access_key_id,
-            aws_secret_access_key=aws_credentials.aws_secret_access_key,
-            region_name=aws_credentials.region,
-        )
+        self.describe_cache = describe_cache.DescribeCache(self.ec2_client, aws_credentials)
+        self.readiness_timings = readiness.ReadinessTimings()
 
     @staticmethod
     def _get_ec2_client(aws_credentials: schemas.AWSCredentials):
+        # Only the client, it is thread safe unlike resources and the engine calls it from many threads
         logger.info("Get EC2 client")
-        return boto3.client(
-            "ec2",
-            aws_access_key_id=aws_credentials.aws_access_key_id,
-            aws_secret_access_key=aws_credentials.aws_secret_access_key,
-            region_name=aws_credentials.region,
-        )
+        return aws.get_ec2_client(aws_credentials)
 
     @abstractmethod
-    def on_ssh_connection(self, ssh_client: paramiko.SSHClient):
+    def on_ssh_connection(self, ssh_client: ssh.SSHConnection):
         ...
 
     def launch(self):
-        """Create service with node and service config."""
-        self._create_service_key_pairs()
-        self._create_security_group()
-        self._launch_single_node()
+        """Create service with node and service config.
 
-        time.sleep(10)
-        ssh_client = self._establish_ssh_connection()
+        Runs every launch step in order, steps completed by an earlier attempt are skipped.
+        """
+        for step in LaunchStep:
+            self.run_step(step)
+
+    def run_step(self, step: LaunchStep) -> None:
+        """Run a single launch step unless it is checkpointed as completed for this service.
+
+        The checkpoint is committed together with the state writes staged by the step.
+        """
+        if not self._begin_step(step):
+            return
+        with tracing.span(f"launch step {step.value}", service_id=self.service_config.service_id):
+            self._step_actions[step]()
+        self._complete_step(step)
+
+    async def arun_step(self, step: LaunchStep) -> None:
+        """`run_step` for the asyncio provisioning engine.
+
+        Waiting for the nodes happens on the event loop, every other blocking call,
+        the `on_ssh_connection` hook included, runs on a thread.
+        """
+        if not await self._in_thread(self._begin_step, step):
+            return
+        with tracing.span(f"launch step {step.value}", service_id=self.service_config.service_id):
+            await self._async_step_actions[step]()
+        await self._in_thread(self._complete_step, step)
+
+    async def _in_thread(self, action: Callable[..., T], *args) -> T:
+        """Run a blocking call on a thread, which returns the connection of the session before it is free again.
 
-        session = SessionLocal()
-        session.query(models.Service).filter(models.Service.name == self.service_config.name).update(
-            {
-                "state": ServiceState.running,
-                "public_ip_address": self.public_ip_address
-            }
+        A launch holding a connection while it waits for a thread starves the launches
+        that hold a thread while they wait for a connection.
+        """
+        def run():
+            try:
+                return action(*args)
+            finally:
+                self.uow.release()
+
+        return await asyncio.to_thread(run)
+
+    def _begin_step(self, step: LaunchStep) -> bool:
+        """Whether the step is not checkpointed yet, the connection goes back to the pool either way."""
+        completed = crud.launch_checkpoint.completed_steps(
+            db=self.uow.session, service_id=self.service_config.service_id
         )
-        session.commit()
-        self.on_ssh_connection(ssh_client)
+        self.uow.release()
+        if step in completed:
+            logger.info("Skip completed launch step %s", step.value)
+            return False
+        logger.info("Run launch step %s", step.value)
+        return True
+
+    def _complete_step(self, step: LaunchStep) -> None:
+        crud.launch_checkpoint.mark_completed(
+            db=self.uow.session, service_id=self.service_config.service_id, step=step
+        )
+        self.uow.commit()
 
+    @property
+    def _step_actions(self):
+        return {
+            LaunchStep.key_pair: self._create_service_key_pairs,
+            LaunchStep.security_group: self._create_security_group,
+            LaunchStep.nodes: self._launch_nodes,
+            LaunchStep.bootstrap: self._bootstrap,
+        }
+
+    @property
+    def _async_step_actions(self):
+        return {
+            LaunchStep.key_pair: lambda: self._in_thread(self._create_service_key_pairs),
+            LaunchStep.security_group: lambda: self._in_thread(self._create_security_group),
+            LaunchStep.nodes: self._alaunch_nodes,
+            LaunchStep.bootstrap: self._abootstrap,
+        }
+
+    def _bootstrap(self) -> None:
+        with metrics.launch_phase(metrics.SSH_CONNECT):
+            self._wait_until_reachable()
+            ssh_client = self._connect_primary_node()
+        with metrics.launch_phase(metrics.BOOTSTRAP):
+            self.on_ssh_connection(ssh_client)
+
+    async def _abootstrap(self) -> None:
+        with metrics.launch_phase(metrics.SSH_CONNECT):
+            await self._await_until_reachable()
+            ssh_client = await self._in_thread(self._connect_primary_node)
+        with metrics.launch_phase(metrics.BOOTSTRAP):
+            await self._in_thread(self.on_ssh_connection, ssh_client)
+
+    def _connect_primary_node(self) -> ssh.SSHConnection:
+        """Connect to the primary node, the service is running from then on."""
+        ssh_client = self._establish_ssh_connection()
+        self._stage_state(
+            events.SERVICE, self.service_config.service_id, ServiceState.running,
+            public_ip_address=self.public_ip_address
+        )
+        self.uow.release()
+        return ssh_client
+
+    @metrics.launch_phase(metrics.KEY_PAIR)
     def _create_service_key_pairs(self) -> None:
         """Amazon EC2 stores the public key and our service saves the private key to the database.
 
         The key pair name is inherited by the service name.
         """
         logger.info("Create EC2 key pairs")
+        session = self.uow.session
+        if crud.key_pair.get_by_service(db=session, service_id=self.service_config.service_id) is not None:
+            logger.info("Key pair of service %s already stored", self.service_name)
+            return
+
+        try:
+            boto_key_pair = self.ec2_client.create_key_pair(
+                KeyName=self.service_config.name)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "InvalidKeyPair.Duplicate":
+                raise
+            # Left over by an attempt that failed before storing the private key, which is lost
+            logger.info("Replace orphaned key pair %s", self.service_config.name)
+            self.ec2_client.delete_key_pair(KeyName=self.service_config.name)
+            boto_key_pair = self.ec2_client.create_key_pair(
+                KeyName=self.service_config.name)
 
-        boto_key_pair = self.ec2_resource.create_key_pair(
-            KeyName=self.service_config.name)
-
-        session = SessionLocal()
         crud.key_pair.create(
             db=session, obj_in=schemas.KeyPairCreate(
                 name=self.service_config.name,
-                key_fingerprint=boto_key_pair.key_fingerprint,
-                key_material=boto_key_pair.key_material,
+                key_fingerprint=boto_key_pair["KeyFingerprint"],
+                key_material=boto_key_pair["KeyMaterial"],
                 service_id=self.service_config.service_id
             )
         )
 
+    @metrics.launch_phase(metrics.SECURITY_GROUP)
     def _create_security_group(self) -> None:
         """An Amazon EC2 security group acts as a virtual firewall that controls the traffic for one or more instances.
 
         You add rules to each security group to allow traffic to or from its associated instances.
         """
         logger.info("Create security group")
-        response = self.ec2_resource.create_security_group(
-            GroupName=self.security_group_name, VpcId=self.default_vpc_name, Description=f"Security group for service {self.service_name}"
-        )
+        try:
+            group_id = self.ec2_client.create_security_group(
+                GroupName=self.security_group_name, VpcId=self.default_vpc_name, Description=f"Security group for service {self.service_name}"
+            )["GroupId"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "InvalidGroup.Duplicate":
+                raise
+            logger.info("Reuse existing security group %s", self.security_group_name)
+            group_id = self.security_group_id
         logger.info(
-            "Security group created [%s, %s]", response.group_id, response.group_name
+            "Security group created [%s, %s]", group_id, self.security_group_name
         )
         logger.info(
             "Create ingress rule for security group %s",
-            response.group_id
+            group_id
         )
         # An inbound rule permits instances to receive traffic from the specified IPv4 or IPv6 CIDR address range,
         # or from the instances that are associated with the specified destination security groups.
-        response.authorize_ingress(
-            GroupName=self.security_group_name, IpProtocol="tcp", CidrIp="0.0.0.0/0", FromPort=22, ToPort=22,
-        )
+        try:
+            self.ec2_client.authorize_security_group_ingress(
+                GroupId=group_id, IpProtocol="tcp", CidrIp="0.0.0.0/0", FromPort=22, ToPort=22,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "InvalidPermission.Duplicate":
+                raise
+        self.describe_cache.invalidate(describe_cache.SECURITY_GROUP, self.security_group_name)
         logger.info(
             "Ingress rule for security group %s created",
-            response.group_id
+            group_id
         )
 
-    def _launch_single_node(self):
-        logger.info("Create EC2 instance")
-        session = SessionLocal()
-        node = crud.node.create(
-            db=session, obj_in=schemas.NodeCreate(
-                state=NodeState.pending, service_id=self.service_config.service_id)
+    def _launch_nodes(self) -> None:
+        """Launch all nodes of the service with a single request and wait for them together."""
+        node_ids, instance_ids, from_warm_pool = self._start_nodes()
+        started = time.monotonic()
+        with metrics.launch_phase(metrics.WAIT_UNTIL_RUNNING):
+            descriptions = readiness.wait_until_running(
+                self.ec2_client, instance_ids, timeout=settings.NODE_READY_TIMEOUT, starting=from_warm_pool
+            )
+        self.readiness_timings.instance_running = time.monotonic() - started
+        self._nodes_running(node_ids, instance_ids, descriptions, from_warm_pool)
+
+    async def _alaunch_nodes(self) -> None:
+        node_ids, instance_ids, from_warm_pool = await self._in_thread(self._start_nodes)
+        started = time.monotonic()
+        with metrics.launch_phase(metrics.WAIT_UNTIL_RUNNING):
+            descriptions = await readiness.await_until_running(
+                self.ec2_client, instance_ids, timeout=settings.NODE_READY_TIMEOUT, starting=from_warm_pool
+            )
+        self.readiness_timings.instance_running = time.monotonic() - started
+        await self._in_thread(self._nodes_running, node_ids, instance_ids, descriptions, from_warm_pool)
+
+    def _start_nodes(self) -> tuple[list[int], list[str], bool]:
+        """Launch or claim the nodes unless an earlier attempt did, returns their node and instance ids."""
+        session = self.uow.session
+        launched = crud.node.get_launched(db=session, service_id=self.service_config.service_id)
+        if launched:
+            logger.info("Resume waiting for the launched nodes of service %s", self.service_name)
+            node_ids = [node_id for node_id, _, _ in launched]
+            instance_ids = [instance_id for _, instance_id, _ in launched]
+            from_warm_pool = any(claimed for _, _, claimed in launched)
+        else:
+            with metrics.launch_phase(metrics.RUN_INSTANCES):
+                claimed = self._claim_warm_pool_nodes(session)
+                from_warm_pool = claimed is not None
+                if from_warm_pool:
+                    node_ids = [node_id for node_id, _ in claimed]
+                    instance_ids = [instance_id for _, instance_id in claimed]
+                else:
+                    node_ids, instance_ids = self._create_instances(session)
+            self._publish_states(events.NODE, node_ids, NodeState.pending)
+        if from_warm_pool:
+            self._attach_warm_pool_nodes(instance_ids)
+        logger.info(
+            "EC2 instances %s have been launched. Wait until running.", instance_ids
+        )
+        self.uow.release()
+        return node_ids, instance_ids, from_warm_pool
+
+    def _nodes_running(
+        self, node_ids: list[int], instance_ids: list[str], descriptions: dict[str, dict], from_warm_pool: bool
+    ) -> None:
+        # Launch order is kept, the first instance is the primary node of the service
+        self._instance_descriptions = [descriptions[instance_id] for instance_id in instance_ids]
+
+        for node_id, description in zip(node_ids, self._instance_descriptions):
+            self._stage_state(
+                events.NODE, node_id, NodeState.running, public_ip_address=description.get("PublicIpAddress")
+            )
+        logger.info(
+            "EC2 instances %s have been started after %.1fs",
+            instance_ids, self.readiness_timings.instance_running
+        )
+        if from_warm_pool:
+            self._authorize_service_key()
+
+    def _stage_state(self, resource: str, id: int, state: enum.Enum, **values) -> None:
+        """Stage a state write of the service or one of its nodes, the transition is published once committed."""
+        model = models.Service if resource == events.SERVICE else models.Node
+        self.uow.stage(model, id, state=state, **values)
+        self.uow.after_commit(lambda: self._publish_states(resource, [id], state))
+
+    def _publish_states(self, resource: str, ids: list[int], state: enum.Enum) -> None:
+        events.publish(
+            events.StateEvent(service_id=self.service_config.service_id, resource=resource, id=id, state=state.value)
+            for id in ids
+        )
+
+    def _claim_warm_pool_nodes(self, session) -> list[tuple[int, str]] | None:
+        pool = warm_pool.find_pool(self.aws_credentials.region, self.node_config)
+        if pool is None:
+            return None
+        return warm_pool.claim(
+            session, pool, service_id=self.service_config.service_id,
+            min_count=self.node_config.min_count, max_count=self.node_config.max_count
         )
 
-        instances = self.ec2_resource.create_instances(
+    def _attach_warm_pool_nodes(self, instance_ids: list[str]) -> None:
+        """Move claimed standby nodes into the service's security group and start them."""
+        logger.info("Attach warm pool nodes %s to service %s", instance_ids, self.service_name)
+        for instance_id in instance_ids:
+            self.ec2_client.modify_instance_attribute(InstanceId=instance_id, Groups=[self.security_group_id])
+        self.ec2_client.create_tags(
+            Resources=instance_ids,
+            Tags=[
+                {"Key": "Name", "Value": self.service_config.name},
+                {"Key": AWS_SERVICE_TAG_KEY, "Value": str(self.service_config.service_id)},
+            ],
+        )
+        self.ec2_client.start_instances(InstanceIds=instance_ids)
+
+    def _authorize_service_key(self) -> None:
+        """Warm pool nodes only trust the pool key, add the service key for all later connections."""
+        pool_key_pair = crud.key_pair.get_by_name(
+            db=self.uow.session, name=warm_pool.pool_key_pair_name(self.aws_credentials.region)
+        )
+        pool_key_material = pool_key_pair.key_material
+        key_material = self._key_material
+        self.uow.release()
+        self._wait_until_reachable()
+        public_key = ssh.ssh_manager.public_key(key_material)
+        connections = [
+            ssh.ssh_manager.connect(host, username=AWS_DEFAULT_AMI_USERNAME, key_material=pool_key_material)
+            for host in self.public_ip_addresses
+        ]
+        results = ssh.run_on_nodes(
+            connections,
+            f"grep -qxF '{public_key}' ~/.ssh/authorized_keys || echo '{public_key}' >> ~/.ssh/authorized_keys",
+            timeout=settings.SSH_COMMAND_TIMEOUT, max_workers=settings.SSH_MAX_PARALLEL_NODES
+        )
+        failed = [result.host for result in results if not result.ok]
+        if failed:
+            raise RuntimeError(f"Could not authorize the service key on {failed}")
+
+    def _create_instances(self, session) -> tuple[list[int], list[str]]:
+        logger.info(
+            "Create EC2 instances [min %s, max %s]",
+            self.node_config.min_count, self.node_config.max_count
+        )
+        response = self.ec2_client.run_instances(
             ImageId=self.node_config.image_id,
             MinCount=self.node_config.min_count,
             MaxCount=self.node_config.max_count,
@@ -132,6 +362,7 @@ class BaseService(ABC):
                     "ResourceType": "instance",
                     "Tags": [
                         {"Key": "Name", "Value": self.service_config.name},
+                        {"Key": AWS_SERVICE_TAG_KEY, "Value": str(self.service_config.service_id)},
                     ],
                 },
             ],
@@ -142,55 +373,100 @@ class BaseService(ABC):
                     "Groups": [self.security_group_id]
                 }
             ],
+            # Idempotent per service, a retried request returns the instances of the first one
+            ClientToken=f"opencheiron-service-{self.service_config.service_id}",
         )
+        instance_ids = [instance["InstanceId"] for instance in response["Instances"]]
 
-        # single node
-        instance = instances[0]
+        node_ids = session.scalars(
+            insert(models.Node).returning(models.Node.id, sort_by_parameter_order=True),
+            [
+                {
+                    "state": NodeState.pending,
+                    "service_id": self.service_config.service_id,
+                    "instance_id": instance_id,
+                    "region": self.aws_credentials.region,
+                    "instance_type": self.node_config.instance_type.value,
+                    "image_id": self.node_config.image_id,
+                }
+                for instance_id in instance_ids
+            ],
+        ).all()
+        session.commit()
+        return node_ids, instance_ids
+
+    def _wait_until_reachable(self) -> None:
+        """Probe the SSH port and banner of all running nodes until they accept connections."""
+        addresses = self.public_ip_addresses
+        logger.info("Wait until %s are reachable", addresses)
+        node_timings = [readiness.ReadinessTimings() for _ in addresses]
+        with ThreadPoolExecutor(max_workers=len(addresses)) as executor:
+            futures = [
+                executor.submit(
+                    readiness.wait_until_reachable, address, settings.SSH_PORT,
+                    timeout=settings.NODE_READY_TIMEOUT, timings=timings
+                )
+                for address, timings in zip(addresses, node_timings)
+            ]
+            for future in futures:
+                future.result()
+        self._record_reachability(node_timings)
+
+    async def _await_until_reachable(self) -> None:
+        # Describing the instances blocks
+        addresses = await self._in_thread(lambda: self.public_ip_addresses)
+        logger.info("Wait until %s are reachable", addresses)
+        node_timings = [readiness.ReadinessTimings() for _ in addresses]
+        await asyncio.gather(*(
+            readiness.await_until_reachable(
+                address, settings.SSH_PORT, timeout=settings.NODE_READY_TIMEOUT, timings=timings
+            )
+            for address, timings in zip(addresses, node_timings)
+        ))
+        self._record_reachability(node_timings)
+
+    def _record_reachability(self, node_timings: list[readiness.ReadinessTimings]) -> None:
+        # The service is as ready as its slowest node
+        timings = self.readiness_timings
+        timings.tcp_reachable = max(node.tcp_reachable for node in node_timings)
+        timings.ssh_banner = max(node.ssh_banner for node in node_timings)
         logger.info(
-            f'EC2 instance "{instance.id}" has been launched. Wait until running.'
+            "Nodes ready after %.1fs [running %.1fs, tcp %.1fs, ssh banner %.1fs]",
+            timings.total, timings.instance_running, timings.tcp_reachable, timings.ssh_banner
         )
-        instance.wait_until_running()
-        session = SessionLocal()
-        session.query(models.Node).filter(models.Node.id == node.id).update(
-            {
-                "public_ip_address": self.public_ip_address,
-                "state": NodeState.running
-            }
-        )
-        session.commit()
-        logger.info(f'EC2 instance "{instance.id}" has been started')
 
-    def _establish_ssh_connection(self):
+    def _establish_ssh_connection(self) -> ssh.SSHConnection:
         logger.info(
             "Connecting to EC2 instance via %s",
             self.public_ip_address
         )
-        session = SessionLocal()
-        service_key_pair = session.query(models.KeyPair).filter(
-            models.KeyPair.service_id == self.service_config.service_id
-        ).first()
-        if service_key_pair is None:
-            # TODO: handle multiple key pairs
-            raise RuntimeError(
-                f"No key pair for service id {self.service_config.service_id} found")
-
-        # Emulate file (or file-like) object in order to receive an RSA key
-        in_memory_buffer = StringIO(service_key_pair.key_material)
-        private_key = paramiko.RSAKey.from_private_key(in_memory_buffer)
-        in_memory_buffer.close()
+        connection = self._ssh_connection(self.public_ip_address)
 
-        client = paramiko.SSHClient()
-        policy = paramiko.AutoAddPolicy()
-        client.set_missing_host_key_policy(policy)
+        _, _stdout, _ = connection.exec_command("whoami")
+        logger.info("Connected as %s", _stdout.read())
+        logger.debug("SSH connection stats %s", ssh.ssh_manager.stats())
+        return connection
 
-        client.connect(
-            self.public_ip_address,
-            username="ubuntu", pkey=private_key
+    def _ssh_connection(self, host: str) -> ssh.SSHConnection:
+        return ssh.ssh_manager.connect(
+            host, username=AWS_DEFAULT_AMI_USERNAME, key_material=self._key_material
         )
 
-        _, _stdout, _ = client.exec_command("whoami")
-        logger.info("Connected as %s", _stdout.read())
-        return client
+    def run_command(
+        self, command: str, *, timeout: float | None = None, sink: ssh.OutputSink | None = None
+    ) -> list[ssh.CommandResult]:
+        """Run a command on all nodes of the service concurrently.
+
+        Output is streamed to the logger and `sink` while the command runs, the call
+        returns once the slowest node finished or hit the timeout.
+        """
+        connections = [self._ssh_connection(host) for host in self.public_ip_addresses]
+        logger.info("Run %r on %s nodes", command, len(connections))
+        return ssh.run_on_nodes(
+            connections, command,
+            timeout=timeout or settings.SSH_COMMAND_TIMEOUT,
+            max_workers=settings.SSH_MAX_PARALLEL_NODES, sink=sink
+        )
 
     @property
     def service_name(self) -> str:
@@ -212,42 +488,68 @@ class BaseService(ABC):
     def public_ip_address(self) -> str:
         return self._instance_description["PublicIpAddress"]
 
+    @property
+    def runs_baked_image(self) -> bool:
+        """All nodes were launched from an image baked from the bootstrap recipe."""
+        return self.node_config.baked and all(
+            description["ImageId"] == self.node_config.image_id for description in self._instance_descriptions
+        )
+
+    @property
+    def public_ip_addresses(self) -> list[str]:
+        return [description["PublicIpAddress"] for description in self._instance_descriptions]
+
     @property
     def public_dns_name(self) -> str:
         return self._instance_description["PublicDnsName"]
 
-    @cached_property
+    @property
     def _instance_description(self):
+        """Description of the primary node."""
+        return self._instance_descriptions[0]
+
+    @cached_property
+    def _instance_descriptions(self):
         response = self.ec2_client.describe_instances(
-            Filters=[{
-                'Name': 'tag:Name',
-                'Values': [
-                    self.service_name
-                ]
-            }]
+            Filters=[
+                {'Name': f'tag:{AWS_SERVICE_TAG_KEY}', 'Values': [str(self.service_config.service_id)]},
+                {'Name': 'instance-state-name', 'Values': ['pending', 'running']},
+            ]
         )
         logger.debug(
-            "Cache instance description for service %s",
+            "Cache instance descriptions for service %s",
             self.service_name
         )
-        return response["Reservations"][0]["Instances"][0]
+        instances = [instance for reservation in response["Reservations"] for instance in reservation["Instances"]]
+        return sorted(instances, key=lambda instance: instance["AmiLaunchIndex"])
 
     @cached_property
-    def _security_group_description(self):
-        response = self.ec2_client.describe_security_groups(
-            Filters=[
-                dict(Name='group-name', Values=[self.security_group_name])
-            ]
+    def _key_material(self) -> str:
+        service_key_pair = crud.key_pair.get_by_service(
+            db=self.uow.session, service_id=self.service_config.service_id
         )
+        if service_key_pair is None:
+            # TODO: handle multiple key pairs
+            raise RuntimeError(
+                f"No key pair for service id {self.service_config.service_id} found")
+        return service_key_pair.key_material
+
+    @cached_property
+    def _security_group_description(self):
+        description = self.describe_cache.security_group(self.security_group_name)
+        if description is None:
+            raise RuntimeError(f"Security group {self.security_group_name} does not exist")
         logger.debug(
             "Cache security group description for %s",
             self.security_group_name
         )
-        return response['SecurityGroups'][0]
+        return description
 
     @cached_property
     def _vpc_description(self):
         # TODO: Use a specific VPC for service creation
-        response = self.ec2_client.describe_vpcs()
+        description = self.describe_cache.vpc()
+        if description is None:
+            raise RuntimeError(f"No VPC in region {self.aws_credentials.region}")
         logger.debug("Cache default vpc description")
-        return response["Vpcs"][0]
+        return description
@@ -0,0 +1,52 @@
+"""Services built from their database record, for the celery worker and the provisioning engine."""
+from celery.utils.log import get_task_logger
+
+from core import aws, describe_cache, images
+from core.magic import ImageState
+from core.services.pg import PGService
+from db.unit_of_work import UnitOfWork
+import crud
+import schemas
+
+logger = get_task_logger(__name__)
+
+
+def recipe_hash(node_config: schemas.NodeConfig) -> str:
+    return images.recipe_hash(PGService.bootstrap_recipe, node_config.image_id)
+
+
+def node_config(session, aws_credentials: schemas.AWSCredentials) -> schemas.NodeConfig:
+    """Node config of the region using the baked image of the bootstrap recipe if there is one."""
+    base_node_config = schemas.NodeConfig.for_region(aws_credentials.region)
+    image = crud.machine_image.get_by_recipe(
+        db=session, recipe_hash=recipe_hash(base_node_config), region=aws_credentials.region
+    )
+    if image is not None and image.state == ImageState.available:
+        cache = describe_cache.DescribeCache(aws.get_ec2_client(aws_credentials), aws_credentials)
+        if cache.image(image.image_id) is not None:
+            return schemas.NodeConfig(image_id=image.image_id, baked=True, base_image_id=base_node_config.image_id)
+        logger.warning("Baked image %s is no longer registered", image.image_id)
+    return base_node_config
+
+
+def bake_wanted(session, region: str) -> bool:
+    """Whether the bootstrap recipe of the region has no image that is available or being baked."""
+    return not crud.machine_image.is_baked_or_baking(
+        db=session, recipe_hash=recipe_hash(schemas.NodeConfig.for_region(region)), region=region
+    )
+
+
+def build_service(uow: UnitOfWork, service_id: int) -> PGService:
+    service_db = crud.service.get(db=uow.session, id=service_id)
+    if service_db is None:
+        raise RuntimeError("Service does not exist")
+    service = schemas.Service.from_orm(service_db)
+    aws_credentials = schemas.AWSCredentials.from_settings(region=service.region)
+
+    # create service with node and service config
+    service_config = schemas.ServiceConfig(
+        name=service.name, service_id=service.id)
+    return PGService(
+        aws_credentials=aws_credentials, node_config=node_config(uow.session, aws_credentials),
+        service_config=service_config, uow=uow
+    )
@@ -1,21 +1,30 @@
-import paramiko
 from celery.utils.log import get_task_logger
 
 from core.services import BaseService
+from core.ssh import SSHConnection
 
 
 logger = get_task_logger(__name__)
 
 
 class PGService(BaseService):
+    bootstrap_recipe = (
+        "sudo apt-get update -y",
+    )
 
-    def on_ssh_connection(self, ssh_client: paramiko.SSHClient):
+    def on_ssh_connection(self, ssh_client: SSHConnection):
         """Entry point for service based actions."""
         ...
-        self.ssh_client: paramiko.SSHClient = ssh_client
+        self.ssh_client: SSHConnection = ssh_client
         self.boostrap()
 
     def boostrap(self):
+        if self.runs_baked_image:
+            logger.info("Nodes run a baked image, skip bootstrap recipe")
+            return
         logger.info("Download package list from repositories")
-        _, _stdout, _ = self.ssh_client.exec_command("sudo apt-get update -y")
-        logger.debug(_stdout.read())
+        for command in self.bootstrap_recipe:
+            results = self.run_command(command)
+            failed = [result for result in results if not result.ok]
+            if failed:
+                raise RuntimeError(f"Bootstrap failed on {[result.host for result in failed]}")
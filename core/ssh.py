@@ -0,0 +1,318 @@
+"""Worker scoped SSH connections.
+
+One authenticated transport is kept per node and shared by all commands sent to it,
+every command runs on its own channel of that transport. Transports send keepalives,
+are closed after being idle for a while and are re-established when they drop.
+"""
+import contextvars
+import hashlib
+import select
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import StringIO
+from typing import Callable, Dict, List, Sequence, Set, Tuple
+
+import paramiko
+from celery.signals import worker_process_init
+from celery.utils.log import get_task_logger
+
+from core import tracing
+from core.config import settings
+
+logger = get_task_logger(__name__)
+
+
+@dataclass(frozen=True)
+class NodeAddress:
+    host: str
+    port: int
+    username: str
+
+
+# Transports are shared per node and key, one authenticated with another key is never reused
+_PoolKey = Tuple[NodeAddress, str]
+
+
+@dataclass
+class _PooledTransport:
+    transport: paramiko.Transport
+    last_used: float = field(default_factory=time.monotonic)
+    channels: Set[paramiko.Channel] = field(default_factory=set)
+
+    def in_use(self, now: float) -> bool:
+        """Whether a channel is still open, the transport counts as used until its last channel closed."""
+        open_channels = {channel for channel in self.channels if not channel.closed}
+        if len(open_channels) < len(self.channels):
+            self.last_used = now
+        self.channels = open_channels
+        return bool(open_channels)
+
+
+class SSHConnection:
+    """Handle on the shared transport of a node, offers the `exec_command` API of `paramiko.SSHClient`."""
+
+    def __init__(self, manager: "SSHConnectionManager", address: NodeAddress, private_key: paramiko.PKey) -> None:
+        self._manager = manager
+        self.address = address
+        self._private_key = private_key
+
+    def open_channel(self, timeout: float | None = None) -> paramiko.Channel:
+        return self._manager.open_channel(self.address, self._private_key, timeout=timeout)
+
+    def exec_command(self, command: str, timeout: float | None = None) -> Tuple[paramiko.ChannelFile, paramiko.ChannelFile, paramiko.ChannelFile]:
+        channel = self.open_channel(timeout=timeout)
+        channel.settimeout(timeout)
+        channel.exec_command(command)
+        stdin = channel.makefile_stdin("wb", -1)
+        stdout = channel.makefile("r", -1)
+        stderr = channel.makefile_stderr("r", -1)
+        return stdin, stdout, stderr
+
+
+@dataclass
+class CommandResult:
+    host: str
+    exit_code: int | None
+    timed_out: bool = False
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+
+OutputSink = Callable[[str, str, str], None]
+"""Receives (host, stream name, line) for every line a command writes."""
+
+READ_CHUNK_SIZE = 32768
+POLL_INTERVAL = 0.5
+# Commands are recorded on their span up to this many characters
+COMMAND_ATTRIBUTE_LENGTH = 200
+
+
+class _LineSplitter:
+    def __init__(self, host: str, stream: str, sink: OutputSink | None) -> None:
+        self.host = host
+        self.stream = stream
+        self.sink = sink
+        self._pending = b""
+
+    def feed(self, data: bytes) -> None:
+        *lines, self._pending = (self._pending + data).split(b"\n")
+        for line in lines:
+            self._emit(line)
+
+    def flush(self) -> None:
+        if self._pending:
+            self._emit(self._pending)
+            self._pending = b""
+
+    def _emit(self, raw: bytes) -> None:
+        line = raw.decode(errors="replace").rstrip("\r")
+        logger.info("[%s %s] %s", self.host, self.stream, line)
+        if self.sink is not None:
+            self.sink(self.host, self.stream, line)
+
+
+def run_command(connection: SSHConnection, command: str, *, timeout: float, sink: OutputSink | None = None) -> CommandResult:
+    """Run `command` and stream its output line by line instead of buffering it, `timeout` bounds the whole run."""
+    with tracing.span("ssh command", host=connection.address.host, command=command[:COMMAND_ATTRIBUTE_LENGTH]) as command_span:
+        result = _run_command(connection, command, timeout=timeout, sink=sink)
+        command_span.attributes.update(exit_code=result.exit_code, timed_out=result.timed_out)
+        if not result.ok:
+            command_span.status = tracing.ERROR
+            command_span.error = result.error or f"exit code {result.exit_code}"
+        return result
+
+
+def _run_command(connection: SSHConnection, command: str, *, timeout: float, sink: OutputSink | None) -> CommandResult:
+    host = connection.address.host
+    deadline = time.monotonic() + timeout
+    try:
+        channel = connection.open_channel(timeout=timeout)
+        channel.exec_command(command)
+    except (paramiko.SSHException, OSError) as e:
+        return CommandResult(host=host, exit_code=None, error=str(e))
+
+    stdout = _LineSplitter(host, "stdout", sink)
+    stderr = _LineSplitter(host, "stderr", sink)
+    with channel:
+        while True:
+            while channel.recv_ready():
+                stdout.feed(channel.recv(READ_CHUNK_SIZE))
+            while channel.recv_stderr_ready():
+                stderr.feed(channel.recv_stderr(READ_CHUNK_SIZE))
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                stdout.flush()
+                stderr.flush()
+                logger.warning("Command on %s timed out after %ss", host, timeout)
+                return CommandResult(host=host, exit_code=None, timed_out=True)
+            select.select([channel], [], [], min(POLL_INTERVAL, remaining))
+        stdout.flush()
+        stderr.flush()
+        return CommandResult(host=host, exit_code=channel.recv_exit_status())
+
+
+def run_on_nodes(
+    connections: Sequence[SSHConnection], command: str, *, timeout: float, max_workers: int, sink: OutputSink | None = None
+) -> List[CommandResult]:
+    """Run `command` on all nodes at once, results are in the order of `connections`."""
+    if not connections:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(connections))) as executor:
+        futures = [
+            # Each thread runs in a copy of the caller's context to keep its trace
+            executor.submit(
+                contextvars.copy_context().run, run_command, connection, command, timeout=timeout, sink=sink
+            )
+            for connection in connections
+        ]
+        return [future.result() for future in futures]
+
+
+class SSHConnectionManager:
+    def __init__(self, *, connect_timeout: float, keepalive_interval: int, idle_timeout: float) -> None:
+        self.connect_timeout = connect_timeout
+        self.keepalive_interval = keepalive_interval
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._address_locks: Dict[_PoolKey, threading.Lock] = {}
+        self._transports: Dict[_PoolKey, _PooledTransport] = {}
+        self._private_keys: Dict[str, paramiko.PKey] = {}
+        self.handshakes = 0
+        self.handshakes_saved = 0
+
+    def connect(self, host: str, *, username: str, key_material: str, port: int | None = None) -> SSHConnection:
+        address = NodeAddress(host=host, port=port or settings.SSH_PORT, username=username)
+        return SSHConnection(self, address, self._private_key(key_material))
+
+    def open_channel(self, address: NodeAddress, private_key: paramiko.PKey, timeout: float | None = None) -> paramiko.Channel:
+        """A new channel on the shared transport, the transport is not evicted while the channel is open."""
+        key = (address, self._fingerprint(private_key))
+        pooled = self._transport(key, private_key)
+        try:
+            channel = pooled.transport.open_session(timeout=timeout)
+        except (paramiko.SSHException, EOFError, OSError):
+            # The remote end went away between the liveness check and the request
+            logger.info("Reconnect to %s", address.host)
+            self._discard(key)
+            pooled = self._transport(key, private_key)
+            channel = pooled.transport.open_session(timeout=timeout)
+        with self._lock:
+            pooled.channels.add(channel)
+        return channel
+
+    def evict_idle(self) -> None:
+        """Close transports without open channels that were idle for longer than the idle timeout."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                key for key, pooled in self._transports.items()
+                if not pooled.in_use(now) and now - pooled.last_used > self.idle_timeout
+            ]
+        for key in idle:
+            logger.debug("Close idle SSH transport to %s", key[0].host)
+            self._discard(key)
+
+    def close_all(self) -> None:
+        with self._lock:
+            keys = list(self._transports)
+        for key in keys:
+            self._discard(key)
+
+    def reset(self) -> None:
+        """Forget all transports without closing them, e.g. those inherited by a forked process."""
+        with self._lock:
+            self._transports.clear()
+            self._address_locks.clear()
+            self.handshakes = 0
+            self.handshakes_saved = 0
+
+    def public_key(self, key_material: str) -> str:
+        """The authorized_keys line of a private key."""
+        private_key = self._private_key(key_material)
+        return f"{private_key.get_name()} {private_key.get_base64()}"
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "open_transports": len(self._transports),
+            "handshakes": self.handshakes,
+            "handshakes_saved": self.handshakes_saved,
+        }
+
+    def _private_key(self, key_material: str) -> paramiko.PKey:
+        fingerprint = hashlib.sha256(key_material.encode()).hexdigest()
+        with self._lock:
+            private_key = self._private_keys.get(fingerprint)
+            if private_key is None:
+                # Emulate file (or file-like) object in order to receive an RSA key
+                with StringIO(key_material) as in_memory_buffer:
+                    private_key = paramiko.RSAKey.from_private_key(in_memory_buffer)
+                self._private_keys[fingerprint] = private_key
+            return private_key
+
+    @staticmethod
+    def _fingerprint(private_key: paramiko.PKey) -> str:
+        return hashlib.sha256(private_key.asbytes()).hexdigest()
+
+    def _address_lock(self, key: _PoolKey) -> threading.Lock:
+        with self._lock:
+            return self._address_locks.setdefault(key, threading.Lock())
+
+    def _transport(self, key: _PoolKey, private_key: paramiko.PKey) -> _PooledTransport:
+        self.evict_idle()
+        # Serialize per node so concurrent commands wait for one handshake instead of racing
+        with self._address_lock(key):
+            pooled = self._transports.get(key)
+            if pooled is not None and pooled.transport.is_active():
+                with self._lock:
+                    pooled.last_used = time.monotonic()
+                    self.handshakes_saved += 1
+                return pooled
+            if pooled is not None:
+                self._discard(key)
+            pooled = _PooledTransport(self._handshake(key[0], private_key))
+            with self._lock:
+                self._transports[key] = pooled
+            return pooled
+
+    def _handshake(self, address: NodeAddress, private_key: paramiko.PKey) -> paramiko.Transport:
+        logger.info("Open SSH transport to %s:%s", address.host, address.port)
+        with tracing.span("ssh handshake", host=address.host):
+            sock = socket.create_connection((address.host, address.port), timeout=self.connect_timeout)
+            transport = paramiko.Transport(sock)
+            try:
+                # Host keys are accepted like paramiko.AutoAddPolicy does, nodes are freshly launched by us
+                transport.start_client(timeout=self.connect_timeout)
+                transport.auth_publickey(address.username, private_key)
+            except Exception:
+                transport.close()
+                raise
+        transport.set_keepalive(self.keepalive_interval)
+        with self._lock:
+            self.handshakes += 1
+        return transport
+
+    def _discard(self, key: _PoolKey) -> None:
+        with self._lock:
+            pooled = self._transports.pop(key, None)
+        if pooled is not None:
+            pooled.transport.close()
+
+
+ssh_manager = SSHConnectionManager(
+    connect_timeout=settings.SSH_CONNECT_TIMEOUT,
+    keepalive_interval=settings.SSH_KEEPALIVE_INTERVAL,
+    idle_timeout=settings.SSH_IDLE_TIMEOUT,
+)
+
+
+@worker_process_init.connect(weak=False)
+def reset_ssh_manager(**kwargs) -> None:
+    ssh_manager.reset()
@@ -0,0 +1,73 @@
+"""Signatures of the worker's tasks, addressed by name, and the queues they are routed to.
+
+The API dispatches tasks through this module instead of importing the worker, which
+would pull in boto3, paramiko and every service implementation.
+"""
+from typing import List
+
+from celery import Celery, Signature
+from kombu import Queue
+
+from core.config import settings
+
+CREATE_SERVICE_TASK = "create_service_task"
+BAKE_IMAGE_TASK = "bake_image_task"
+
+# Tasks without a region, e.g. the periodic ones, go to Celery's default queue
+DEFAULT_QUEUE = "celery"
+
+
+def region_queue(region: str) -> str:
+    return f"provision.{region}"
+
+
+def engine_queue(region: str) -> str:
+    """Queue the provisioning engine of the region consumes launches from."""
+    return f"provision-engine.{region}"
+
+
+def queue_names() -> List[str]:
+    return [
+        DEFAULT_QUEUE,
+        *(region_queue(region) for region in settings.REGIONS),
+        *(engine_queue(region) for region in settings.PROVISIONING_ENGINE_REGIONS),
+    ]
+
+
+def route_by_region(name, args, kwargs, options, task=None, **kw) -> dict | None:
+    """Route tasks called with a `region` keyword argument to the queue of the region.
+
+    Launches in regions served by the provisioning engine go to the engine's queue.
+    """
+    region = (kwargs or {}).get("region")
+    if region is None:
+        return None
+    if name == CREATE_SERVICE_TASK and region in settings.PROVISIONING_ENGINE_REGIONS:
+        return {"queue": engine_queue(region)}
+    return {"queue": region_queue(region)}
+
+
+def configure(app: Celery) -> None:
+    """Broker and routing shared by the API and the worker.
+
+    A worker started without `-Q` consumes every queue, one pool per region
+    consumes only its region's queue. Workers next to a provisioning engine
+    leave its queue to it with `-X`.
+    """
+    app.conf.broker_url = settings.CELERY_BROKER_URL
+    app.conf.result_backend = settings.CELERY_BROKER_URL
+    app.conf.task_queues = [Queue(queue, routing_key=queue) for queue in queue_names()]
+    app.conf.task_default_queue = DEFAULT_QUEUE
+    app.conf.task_routes = (route_by_region,)
+
+
+celery = Celery(__name__)
+configure(celery)
+
+
+def create_service(service_id: int, region: str) -> Signature:
+    return celery.signature(CREATE_SERVICE_TASK, args=(service_id,), kwargs={"region": region})
+
+
+def bake_image(region: str) -> Signature:
+    return celery.signature(BAKE_IMAGE_TASK, kwargs={"region": region})
@@ -0,0 +1,199 @@
+"""Distributed tracing of a service launch from the API request down to single AWS and SSH calls.
+
+Trace context follows the W3C `traceparent` format. It is carried in the headers of
+HTTP requests and celery task messages, within a process it lives in a context
+variable. Finished spans are handed to the configured exporter, `TRACE_EXPORTER`
+selects one of `EXPORTERS` and `set_exporter` installs any other.
+"""
+import contextvars
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import orjson
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun
+from celery.utils.log import get_task_logger
+
+from core.config import settings
+
+logger = get_task_logger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+
+OK = "ok"
+ERROR = "error"
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @classmethod
+    def from_traceparent(cls, value: str | None) -> Optional["SpanContext"]:
+        try:
+            _, trace_id, span_id, _ = value.strip().split("-")
+        except (AttributeError, ValueError):
+            return None
+        if len(trace_id) != 32 or len(span_id) != 16:
+            return None
+        return cls(trace_id=trace_id, span_id=span_id)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    start: float
+    """Seconds since the epoch."""
+    end: float | None = None
+    status: str = OK
+    error: str | None = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    pid: int = field(default_factory=os.getpid)
+
+    @property
+    def context(self) -> SpanContext:
+        return SpanContext(trace_id=self.trace_id, span_id=self.span_id)
+
+
+class Exporter:
+    def export(self, span: Span) -> None:
+        ...
+
+
+class JSONLinesExporter(Exporter):
+    """Appends one JSON object per span to a local file, safe for threads and forked processes."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = orjson.dumps(asdict(span), default=str) + b"\n"
+        with self._lock, open(self.path, "ab") as file:
+            file.write(line)
+
+
+EXPORTERS: Dict[str, Callable[[], Exporter]] = {
+    "none": Exporter,
+    "jsonl": lambda: JSONLinesExporter(settings.TRACE_FILE),
+}
+
+_exporter: Exporter | None = None
+_current: contextvars.ContextVar[SpanContext | None] = contextvars.ContextVar("trace_context", default=None)
+
+
+def get_exporter() -> Exporter:
+    global _exporter
+    if _exporter is None:
+        _exporter = EXPORTERS[settings.TRACE_EXPORTER]()
+    return _exporter
+
+
+def set_exporter(exporter: Exporter) -> None:
+    global _exporter
+    _exporter = exporter
+
+
+def current() -> SpanContext | None:
+    return _current.get()
+
+
+def start_span(name: str, parent: SpanContext | None = None, **attributes: Any) -> Span:
+    """Start a child of `parent`, by default of the current span, a root span without either.
+
+    The span does not become the current one, see `span` and `activate`.
+    """
+    parent = parent or _current.get()
+    return Span(
+        name=name,
+        trace_id=parent.trace_id if parent is not None else secrets.token_hex(16),
+        span_id=secrets.token_hex(8),
+        parent_id=parent.span_id if parent is not None else None,
+        start=time.time(),
+        attributes=attributes,
+    )
+
+
+def end_span(span: Span, error: BaseException | None = None) -> None:
+    span.end = time.time()
+    if error is not None:
+        span.status = ERROR
+        span.error = f"{type(error).__name__}: {error}"
+    try:
+        get_exporter().export(span)
+    except Exception:
+        logger.warning("Could not export span %s", span.name, exc_info=True)
+
+
+def activate(context: SpanContext | None) -> contextvars.Token:
+    return _current.set(context)
+
+
+def deactivate(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+@contextmanager
+def span(name: str, parent: SpanContext | None = None, **attributes: Any) -> Iterator[Span]:
+    """Run the block in a new span, which is the current span meanwhile."""
+    new_span = start_span(name, parent, **attributes)
+    token = activate(new_span.context)
+    error = None
+    try:
+        yield new_span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        deactivate(token)
+        end_span(new_span, error)
+
+
+# Spans of the celery tasks running in this process, by task id
+_task_spans: Dict[str, tuple[Span, contextvars.Token]] = {}
+
+
+@before_task_publish.connect(weak=False)
+def inject_task_context(headers: Dict[str, Any], **kwargs) -> None:
+    context = _current.get()
+    if context is not None:
+        headers.setdefault(TRACEPARENT_HEADER, context.traceparent)
+
+
+@task_prerun.connect(weak=False)
+def start_task_span(task_id: str, task, args, **kwargs) -> None:
+    traceparent = getattr(task.request, TRACEPARENT_HEADER, None) or (task.request.headers or {}).get(TRACEPARENT_HEADER)
+    task_span = start_span(
+        f"celery {task.name}", SpanContext.from_traceparent(traceparent), task_id=task_id, args=list(args)
+    )
+    _task_spans[task_id] = (task_span, activate(task_span.context))
+
+
+@task_failure.connect(weak=False)
+def fail_task_span(task_id: str, exception: BaseException, **kwargs) -> None:
+    if task_id in _task_spans:
+        task_span, _ = _task_spans[task_id]
+        task_span.status = ERROR
+        task_span.error = f"{type(exception).__name__}: {exception}"
+
+
+@task_postrun.connect(weak=False)
+def end_task_span(task_id: str, **kwargs) -> None:
+    entry = _task_spans.pop(task_id, None)
+    if entry is None:
+        return
+    task_span, token = entry
+    deactivate(token)
+    end_span(task_span)
@@ -0,0 +1,250 @@
+"""Warm pools of pre-provisioned standby nodes.
+
+Standby nodes are launched ahead of demand with a shared pool key pair and tracked as
+nodes without a service. They stay pending until they booted, or stopped again, and only
+then become standby. A launch whose node config matches a pool claims standby nodes
+instead of waiting for new instances to boot. Refills of a pool are serialized with a
+redis lock, nodes a dead refill left booting are terminated by the next one.
+
+Pools hold nodes of the base image only. A launch using the baked image of that base
+image claims them as well, the claimed nodes do not run the baked image and install the
+bootstrap recipe over SSH.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+from botocore.exceptions import ClientError
+from celery.utils.log import get_task_logger
+from redis import RedisError
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from core import readiness
+from core.config import WarmPool, settings
+from core.magic import AWS_WARM_POOL_TAG_KEY, NodeState
+from core.redis import get_redis
+import crud
+import models
+import schemas
+
+logger = get_task_logger(__name__)
+
+HIT = "hits"
+MISS = "misses"
+
+
+def pool_label(pool: WarmPool) -> str:
+    return f"{pool.region}:{pool.instance_type.value}:{pool.image_id}"
+
+
+def counter_key(pool: WarmPool, outcome: str) -> str:
+    return f"opencheiron:warm-pool:{pool_label(pool)}:{outcome}"
+
+
+def refill_lock_key(pool: WarmPool) -> str:
+    return f"opencheiron:warm-pool:{pool_label(pool)}:refill"
+
+
+def pool_key_pair_name(region: str) -> str:
+    return f"opencheiron-pool-{region}"
+
+
+def find_pool(region: str, node_config: schemas.NodeConfig) -> Optional[WarmPool]:
+    for pool in settings.WARM_POOLS:
+        if (pool.region, pool.instance_type, pool.image_id) == (region, node_config.instance_type, node_config.pool_image_id):
+            return pool
+    return None
+
+
+def _pool_node_filters(pool: WarmPool) -> Sequence:
+    return (
+        models.Node.region == pool.region,
+        models.Node.instance_type == pool.instance_type.value,
+        models.Node.image_id == pool.image_id,
+    )
+
+
+def standby_filters(pool: WarmPool) -> Sequence:
+    """Filters selecting the standby nodes of the pool, the nodes claims can take."""
+    return (models.Node.state == NodeState.standby, *_pool_node_filters(pool))
+
+
+def _booting_filters(pool: WarmPool) -> Sequence:
+    """Nodes a refill launched that are not standby yet, the reconciler may have recorded them running or stopped."""
+    return (
+        models.Node.state.not_in((NodeState.standby, NodeState.shutting_down, NodeState.terminated)),
+        models.Node.service_id.is_(None),
+        *_pool_node_filters(pool),
+    )
+
+
+def _count(pool: WarmPool, outcome: str) -> None:
+    # The counters are statistics only, a claim never fails on them
+    try:
+        get_redis().incr(counter_key(pool, outcome))
+    except RedisError:
+        logger.warning("Could not count warm pool %s %s", pool_label(pool), outcome, exc_info=True)
+
+
+def claim(session: Session, pool: WarmPool, *, service_id: int, min_count: int, max_count: int) -> Optional[List[Tuple[int, str]]]:
+    """Attach up to `max_count` standby nodes to the service, None if fewer than `min_count` are available.
+
+    Rows are locked with SKIP LOCKED so concurrent launches never claim the same node.
+    """
+    standby = session.execute(
+        select(models.Node.id, models.Node.instance_id)
+        .where(*standby_filters(pool))
+        .order_by(models.Node.id)
+        .limit(max_count)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if len(standby) < min_count:
+        session.rollback()
+        _count(pool, MISS)
+        logger.info("Warm pool %s miss, %s of %s nodes available", pool_label(pool), len(standby), min_count)
+        return None
+
+    session.execute(
+        update(models.Node),
+        [
+            {"id": node_id, "service_id": service_id, "state": NodeState.pending, "from_warm_pool": True}
+            for node_id, _ in standby
+        ],
+    )
+    session.commit()
+    _count(pool, HIT)
+    logger.info("Warm pool %s hit, claimed %s nodes", pool_label(pool), len(standby))
+    return [(node_id, instance_id) for node_id, instance_id in standby]
+
+
+def standby_count(session: Session, pool: WarmPool) -> int:
+    return session.scalar(select(func.count(models.Node.id)).where(*standby_filters(pool)))
+
+
+def ensure_pool_key_pair(session: Session, ec2_resource, ec2_client, region: str) -> str:
+    """The key pair standby nodes of a region are launched with, its private key is stored without a service."""
+    name = pool_key_pair_name(region)
+    if crud.key_pair.get_by_name(db=session, name=name) is not None:
+        return name
+    try:
+        boto_key_pair = ec2_resource.create_key_pair(KeyName=name)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "InvalidKeyPair.Duplicate":
+            raise
+        ec2_client.delete_key_pair(KeyName=name)
+        boto_key_pair = ec2_resource.create_key_pair(KeyName=name)
+    crud.key_pair.create(
+        db=session, obj_in=schemas.KeyPairCreate(
+            name=name,
+            key_fingerprint=boto_key_pair.key_fingerprint,
+            key_material=boto_key_pair.key_material,
+            service_id=None,
+        )
+    )
+    return name
+
+
+def _terminate(session: Session, ec2_client, node_ids: List[int], instance_ids: List[str]) -> None:
+    ec2_client.terminate_instances(InstanceIds=instance_ids)
+    session.execute(
+        update(models.Node)
+        .where(models.Node.id.in_(node_ids), models.Node.service_id.is_(None))
+        .values(state=NodeState.shutting_down)
+    )
+    session.commit()
+
+
+def refill(session: Session, ec2_resource, ec2_client, pool: WarmPool) -> int:
+    """Launch standby nodes up to the pool size, returns the number of launched nodes.
+
+    Nothing is launched while another refill of the pool runs or redis is unavailable.
+    """
+    # Long enough for a refill waiting for its nodes to boot and stop again
+    lock = get_redis().lock(refill_lock_key(pool), timeout=2 * settings.NODE_READY_TIMEOUT + 300)
+    try:
+        acquired = lock.acquire(blocking=False)
+    except RedisError:
+        logger.warning("Could not lock warm pool %s, skip refill", pool_label(pool), exc_info=True)
+        return 0
+    if not acquired:
+        logger.info("Warm pool %s is refilled already", pool_label(pool))
+        return 0
+    try:
+        return _refill(session, ec2_resource, ec2_client, pool)
+    finally:
+        try:
+            lock.release()
+        except RedisError:
+            logger.warning("Could not unlock warm pool %s", pool_label(pool), exc_info=True)
+
+
+def _refill(session: Session, ec2_resource, ec2_client, pool: WarmPool) -> int:
+    """The nodes are inserted as pending, which claims skip, and become standby once they are
+    running, or stopped again for pools that keep them stopped. Nodes that fail to get
+    there are terminated.
+    """
+    # No other refill runs, booting nodes were left by one that died
+    orphans = session.execute(select(models.Node.id, models.Node.instance_id).where(*_booting_filters(pool))).all()
+    if orphans:
+        logger.warning("Terminate %s nodes a failed refill left in warm pool %s", len(orphans), pool_label(pool))
+        _terminate(
+            session, ec2_client,
+            [node_id for node_id, _ in orphans], [instance_id for _, instance_id in orphans],
+        )
+    deficit = pool.size - standby_count(session, pool)
+    if deficit <= 0:
+        return 0
+    logger.info("Refill warm pool %s with %s nodes", pool_label(pool), deficit)
+    key_name = ensure_pool_key_pair(session, ec2_resource, ec2_client, pool.region)
+    instances = ec2_resource.create_instances(
+        ImageId=pool.image_id,
+        MinCount=1,
+        MaxCount=deficit,
+        InstanceType=pool.instance_type.value,
+        KeyName=key_name,
+        TagSpecifications=[
+            {
+                "ResourceType": "instance",
+                "Tags": [{"Key": AWS_WARM_POOL_TAG_KEY, "Value": pool_label(pool)}],
+            },
+        ],
+        NetworkInterfaces=[{"AssociatePublicIpAddress": True, "DeviceIndex": 0}],
+    )
+    instance_ids = [instance.id for instance in instances]
+    node_ids = session.scalars(
+        insert(models.Node).returning(models.Node.id),
+        [
+            {
+                "state": NodeState.pending,
+                "service_id": None,
+                "instance_id": instance_id,
+                "region": pool.region,
+                "instance_type": pool.instance_type.value,
+                "image_id": pool.image_id,
+            }
+            for instance_id in instance_ids
+        ],
+    ).all()
+    session.commit()
+    try:
+        readiness.wait_until_running(ec2_client, instance_ids, timeout=settings.NODE_READY_TIMEOUT)
+        if pool.keep_stopped:
+            # Stop once booted so the first boot and the disk initialization are paid here
+            ec2_client.stop_instances(InstanceIds=instance_ids)
+            readiness.wait_until_stopped(ec2_client, instance_ids, timeout=settings.NODE_READY_TIMEOUT)
+    except Exception:
+        logger.warning("Refill of warm pool %s failed, terminate its new nodes", pool_label(pool))
+        session.rollback()
+        _terminate(session, ec2_client, node_ids, instance_ids)
+        raise
+    # The reconciler may have recorded the booted state meanwhile, anything not lost becomes standby
+    result = session.execute(
+        update(models.Node)
+        .where(
+            models.Node.id.in_(node_ids),
+            models.Node.service_id.is_(None),
+            models.Node.state.not_in((NodeState.shutting_down, NodeState.terminated)),
+        )
+        .values(state=NodeState.standby)
+    )
+    session.commit()
+    return result.rowcount
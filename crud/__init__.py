@@ -1,3 +1,5 @@
 from .crud_service import service
 from .crud_node import node
 from .crud_key_pair import key_pair
+from .crud_launch_checkpoint import launch_checkpoint
+from .crud_machine_image import machine_image
@@ -1,9 +1,12 @@
-from typing import Any, Generic, List, Optional, Type, TypeVar
+from typing import Any, Generic, List, Optional, Sequence, Type, TypeVar
 
 from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.engine import RowMapping
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from db.base_class import Base
@@ -30,6 +33,30 @@ class CRUDBase(Generic[ModelType, CreateSchemaType]):
     def get_multi(self, db: Session) -> List[ModelType]:
         return db.query(self.model).all()
 
+    @staticmethod
+    def _page_statement(model: Type[ModelType], columns: Sequence[Any], cursor: Optional[int], limit: int, filters: Sequence[Any]):
+        statement = select(*columns).where(*filters).order_by(model.id).limit(limit)
+        if cursor is not None:
+            statement = statement.where(model.id > cursor)
+        return statement
+
+    def get_page(
+        self,
+        db: Session,
+        *,
+        columns: Sequence[Any],
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        filters: Sequence[Any] = (),
+    ) -> List[RowMapping]:
+        """Keyset paginated read of the given columns, ordered by primary key.
+
+        `cursor` is the last id of the previous page. Only the requested columns are
+        loaded, no ORM objects are built.
+        """
+        statement = self._page_statement(self.model, columns, cursor, limit, filters)
+        return db.execute(statement).mappings().all()
+
     def create(self, db: Session, *, obj_in: CreateSchemaType, raise_http_error=True) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data)  # type: ignore
@@ -38,7 +65,42 @@ class CRUDBase(Generic[ModelType, CreateSchemaType]):
             db.commit()
             db.refresh(db_obj)
         except IntegrityError as e:
-            self.db.rollback()
+            db.rollback()
+            if "duplicate key" in str(e) and raise_http_error:
+                raise HTTPException(status_code=409, detail="Conflict Error")
+            else:
+                raise e
+        return db_obj
+
+    async def aget(self, db: AsyncSession, id: Any) -> Optional[ModelType]:
+        return await db.get(self.model, id)
+
+    async def aget_multi(self, db: AsyncSession) -> List[ModelType]:
+        result = await db.scalars(select(self.model))
+        return result.all()
+
+    async def aget_page(
+        self,
+        db: AsyncSession,
+        *,
+        columns: Sequence[Any],
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        filters: Sequence[Any] = (),
+    ) -> List[RowMapping]:
+        statement = self._page_statement(self.model, columns, cursor, limit, filters)
+        result = await db.execute(statement)
+        return result.mappings().all()
+
+    async def acreate(self, db: AsyncSession, *, obj_in: CreateSchemaType, raise_http_error=True) -> ModelType:
+        obj_in_data = jsonable_encoder(obj_in)
+        db_obj = self.model(**obj_in_data)  # type: ignore
+        db.add(db_obj)
+        try:
+            await db.commit()
+            await db.refresh(db_obj)
+        except IntegrityError as e:
+            await db.rollback()
             if "duplicate key" in str(e) and raise_http_error:
                 raise HTTPException(status_code=409, detail="Conflict Error")
             else:
@@ -1,10 +1,18 @@
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
 from crud.base import CRUDBase
 import models
 import schemas
 
 
 class CRUDNode(CRUDBase[models.KeyPair, schemas.KeyPairCreate]):
-    pass
+    def get_by_service(self, db: Session, *, service_id: int) -> Optional[models.KeyPair]:
+        return db.query(self.model).filter(self.model.service_id == service_id).first()
+
+    def get_by_name(self, db: Session, *, name: str) -> Optional[models.KeyPair]:
+        return db.query(self.model).filter(self.model.name == name).first()
 
 
 key_pair = CRUDNode(models.KeyPair)
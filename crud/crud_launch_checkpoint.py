@@ -0,0 +1,26 @@
+from typing import Set
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from core.magic import LaunchStep
+from crud.base import CRUDBase
+import models
+import schemas
+
+
+class CRUDLaunchCheckpoint(CRUDBase[models.LaunchCheckpoint, schemas.LaunchCheckpointCreate]):
+    def completed_steps(self, db: Session, *, service_id: int) -> Set[LaunchStep]:
+        return set(db.scalars(select(self.model.step).where(self.model.service_id == service_id)))
+
+    def mark_completed(self, db: Session, *, service_id: int, step: LaunchStep) -> None:
+        """Record the step in the current transaction, the caller commits it together with the step outcome."""
+        db.execute(
+            insert(self.model)
+            .values(service_id=service_id, step=step)
+            .on_conflict_do_nothing(index_elements=["service_id", "step"])
+        )
+
+
+launch_checkpoint = CRUDLaunchCheckpoint(models.LaunchCheckpoint)
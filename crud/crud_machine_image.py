@@ -0,0 +1,65 @@
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from core.magic import ImageState
+from crud.base import CRUDBase
+import models
+import schemas
+
+
+class CRUDMachineImage(CRUDBase[models.MachineImage, schemas.MachineImageCreate]):
+    def get_by_recipe(self, db: Session, *, recipe_hash: str, region: str) -> Optional[models.MachineImage]:
+        return db.scalar(
+            select(self.model).where(self.model.recipe_hash == recipe_hash, self.model.region == region)
+        )
+
+    def _claimable(self):
+        stale = func.now() - timedelta(seconds=settings.IMAGE_BAKE_TIMEOUT)
+        return or_(
+            self.model.state == ImageState.failed,
+            (self.model.state == ImageState.pending) & (self.model.claimed_at < stale),
+        )
+
+    def is_baked_or_baking(self, db: Session, *, recipe_hash: str, region: str) -> bool:
+        """Whether the recipe's image is available or a live bake claimed it."""
+        return db.scalar(
+            select(self.model.id).where(
+                self.model.recipe_hash == recipe_hash, self.model.region == region, ~self._claimable()
+            )
+        ) is not None
+
+    def claim(self, db: Session, *, obj_in: schemas.MachineImageCreate) -> bool:
+        """Register a pending bake for the recipe, False if another bake exists already.
+
+        A failed bake can be claimed again, so can a pending one claimed longer than a bake
+        may take ago, its worker died before recording the outcome.
+        """
+        statement = insert(self.model).values(**obj_in.dict(), state=ImageState.pending)
+        statement = statement.on_conflict_do_update(
+            index_elements=["recipe_hash", "region"],
+            set_={
+                "state": ImageState.pending,
+                "base_image_id": statement.excluded.base_image_id,
+                "claimed_at": func.now(),
+            },
+            where=self._claimable(),
+        ).returning(self.model.id)
+        claimed = db.scalar(statement) is not None
+        db.commit()
+        return claimed
+
+    def set_state(self, db: Session, *, recipe_hash: str, region: str, state: ImageState, image_id: str | None = None) -> None:
+        db.execute(
+            update(self.model)
+            .where(self.model.recipe_hash == recipe_hash, self.model.region == region)
+            .values(state=state, image_id=image_id)
+        )
+        db.commit()
+
+
+machine_image = CRUDMachineImage(models.MachineImage)
@@ -1,10 +1,22 @@
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
 from crud.base import CRUDBase
 import models
 import schemas
 
 
 class CRUDNode(CRUDBase[models.Node, schemas.NodeCreate]):
-    pass
+    def get_launched(self, db: Session, *, service_id: int) -> List[Row]:
+        """(id, instance_id, from_warm_pool) of the service's nodes that have an instance, in launch order."""
+        return db.execute(
+            select(self.model.id, self.model.instance_id, self.model.from_warm_pool)
+            .where(self.model.service_id == service_id, self.model.instance_id.is_not(None))
+            .order_by(self.model.id)
+        ).all()
 
 
 node = CRUDNode(models.Node)
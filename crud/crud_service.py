@@ -1,10 +1,92 @@
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from core.magic import ServiceState
 from crud.base import CRUDBase
 import models
 import schemas
 
 
 class CRUDService(CRUDBase[models.Service, schemas.ServiceCreate]):
-    pass
+    list_columns = (
+        models.Service.id,
+        models.Service.name,
+        models.Service.state,
+        models.Service.region,
+        models.Service.public_ip_address,
+    )
+
+    @staticmethod
+    def _list_filters(state: Optional[ServiceState], name_prefix: Optional[str]) -> List:
+        filters = []
+        if state is not None:
+            filters.append(models.Service.state == state)
+        if name_prefix:
+            filters.append(models.Service.name.startswith(name_prefix, autoescape=True))
+        return filters
+
+    def get_page_filtered(
+        self,
+        db: Session,
+        *,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        state: Optional[ServiceState] = None,
+        name_prefix: Optional[str] = None,
+    ) -> List[RowMapping]:
+        filters = self._list_filters(state, name_prefix)
+        return self.get_page(db, columns=self.list_columns, cursor=cursor, limit=limit, filters=filters)
+
+    async def aget_page_filtered(
+        self,
+        db: AsyncSession,
+        *,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        state: Optional[ServiceState] = None,
+        name_prefix: Optional[str] = None,
+    ) -> List[RowMapping]:
+        filters = self._list_filters(state, name_prefix)
+        return await self.aget_page(db, columns=self.list_columns, cursor=cursor, limit=limit, filters=filters)
+
+    async def aget_updated_at(self, db: AsyncSession, *, id: Optional[int] = None) -> Optional[datetime]:
+        """Last change of one service, or of any service without an id."""
+        if id is None:
+            return await db.scalar(select(func.max(self.model.updated_at)))
+        return await db.scalar(select(self.model.updated_at).where(self.model.id == id))
+
+    async def acreate_bulk(
+        self, db: AsyncSession, *, objs_in: Sequence[schemas.ServiceCreate]
+    ) -> Tuple[List[RowMapping], List[str]]:
+        """Insert all services with a single multi-row statement.
+
+        Returns the created rows and the names that conflict with an existing service or
+        occur more than once in `objs_in`, those are skipped.
+        """
+        unique_objs = {}
+        conflicts = []
+        for obj_in in objs_in:
+            if obj_in.name in unique_objs:
+                conflicts.append(obj_in.name)
+            else:
+                unique_objs[obj_in.name] = obj_in
+        statement = (
+            insert(self.model)
+            .values([{"name": obj_in.name, "state": obj_in.state, "region": obj_in.region} for obj_in in unique_objs.values()])
+            .on_conflict_do_nothing(index_elements=["name"])
+            .returning(*self.list_columns)
+        )
+        created = (await db.execute(statement)).mappings().all()
+        await db.commit()
+        created_names = {row["name"] for row in created}
+        conflicts.extend(name for name in unique_objs if name not in created_names)
+        return created, conflicts
 
 
 service = CRUDService(models.Service)
@@ -2,3 +2,5 @@ from db.base_class import Base  # noqa
 from models.service import Service  # noqa
 from models.node import Node  # noqa
 from models.key_pair import KeyPair # noqa
+from models.launch_checkpoint import LaunchCheckpoint # noqa
+from models.machine_image import MachineImage # noqa
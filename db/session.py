@@ -1,10 +1,48 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
+from core import metrics
 from core.config import settings
-from db.base_class import Base
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
-Base.metadata.create_all(bind=engine)
+
+class InstrumentedQueuePool(QueuePool):
+    """Queue pool recording how long a checkout waited for a free connection.
+
+    `Engine.connect` checks out through the public `Pool.connect`, the time includes
+    opening a new connection or the pre-ping of a pooled one.
+    """
+
+    def connect(self):
+        with metrics.DB_POOL_CHECKOUT_SECONDS.time():
+            return super().connect()
+
+
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URI,
+    pool_pre_ping=True,
+    poolclass=InstrumentedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+)
+
+metrics.DB_POOL_CAPACITY.set(settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW)
+event.listen(engine, "checkout", lambda *args: metrics.DB_POOL_CHECKED_OUT.inc())
+event.listen(engine, "checkin", lambda *args: metrics.DB_POOL_CHECKED_OUT.dec())
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Used by the API, the celery worker stays on the sync engine
+async_engine = create_async_engine(
+    settings.ASYNC_SQLALCHEMY_DATABASE_URI,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+)
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
@@ -0,0 +1,67 @@
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session, sessionmaker
+
+from db.base_class import Base
+from db.session import SessionLocal
+
+
+class UnitOfWork:
+    """Task scoped database session shared by all steps of a task.
+
+    State writes staged with `stage` are coalesced per row and written as one bulk update
+    on `commit`. Leaving the context commits, or rolls back on error, and always closes
+    the session so its connection goes back to the pool.
+    """
+
+    def __init__(self, session_factory: sessionmaker = SessionLocal) -> None:
+        self._session_factory = session_factory
+        self._staged: Dict[Tuple[Type[Base], Any], Dict[str, Any]] = {}
+        self._after_commit: List[Callable[[], None]] = []
+        self.session: Session | None = None
+
+    def __enter__(self) -> "UnitOfWork":
+        self.session = self._session_factory()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.session.close()
+
+    def stage(self, model: Type[Base], id: Any, **values: Any) -> None:
+        """Stage column values of a row, later values for the same column win."""
+        self._staged.setdefault((model, id), {}).update(values)
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """Run `callback` once the next commit succeeded, it is dropped on rollback."""
+        self._after_commit.append(callback)
+
+    def commit(self) -> None:
+        self._flush_staged()
+        self.session.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self) -> None:
+        self._staged.clear()
+        self._after_commit.clear()
+        self.session.rollback()
+
+    def release(self) -> None:
+        """Return the connection to the pool before waiting on something slow, staged writes are kept."""
+        self.session.close()
+
+    def _flush_staged(self) -> None:
+        rows_by_model: Dict[Type[Base], list] = {}
+        for (model, id), values in self._staged.items():
+            rows_by_model.setdefault(model, []).append({"id": id, **values})
+        self._staged.clear()
+        for model, rows in rows_by_model.items():
+            self.session.execute(update(model), rows)
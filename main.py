@@ -1,10 +1,16 @@
+import time
+
 from core.lifespan import LifespanManager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import ORJSONResponse
+from redis import RedisError
+from core import metrics, tasks, tracing
 from core.config import settings
+from core.redis import get_async_redis
 from api.api import api_router
 
 
-app = FastAPI(title=settings.PROJECT_NAME)
+app = FastAPI(title=settings.PROJECT_NAME, default_response_class=ORJSONResponse)
 
 app.include_router(api_router, prefix="/api")
 
@@ -12,3 +18,42 @@ app.include_router(api_router, prefix="/api")
 @app.on_event("startup")
 def startup_event():
     LifespanManager.startup()
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Root span of the request, or a child of the caller's `traceparent`, which is returned in any case."""
+    parent = tracing.SpanContext.from_traceparent(request.headers.get(tracing.TRACEPARENT_HEADER))
+    with tracing.span(f"http {request.method} {request.url.path}", parent) as request_span:
+        response = await call_next(request)
+        request_span.attributes["status"] = response.status_code
+    response.headers[tracing.TRACEPARENT_HEADER] = request_span.context.traceparent
+    return response
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    # Label by route template, raw paths would create a series per service id
+    metrics.HTTP_REQUEST_SECONDS.labels(
+        method=request.method, route=route.path if route is not None else "unmatched", status=response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+async def export_metrics() -> Response:
+    pipeline = get_async_redis().pipeline(transaction=False)
+    queues = tasks.queue_names()
+    for queue in queues:
+        pipeline.llen(queue)
+    try:
+        depths = await pipeline.execute()
+    except RedisError:
+        pass
+    else:
+        metrics.set_queue_depths(zip(queues, depths))
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
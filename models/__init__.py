@@ -1,3 +1,5 @@
 from .service import Service
 from .node import Node
 from .key_pair import KeyPair
+from .launch_checkpoint import LaunchCheckpoint
+from .machine_image import MachineImage
@@ -15,5 +15,5 @@ class KeyPair(Base):
     name = Column(String, index=True, unique=True, nullable=False)
     key_fingerprint = Column(String, nullable=False)
     key_material = Column(String, nullable=False)
-    service_id = Column(Integer, ForeignKey("services.id"))
+    service_id = Column(Integer, ForeignKey("services.id"), index=True)
     owning_service = relationship("Service", back_populates="key_pairs")
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, UniqueConstraint, func
+
+from core.magic import LaunchStep
+from db.base_class import Base
+
+
+class LaunchCheckpoint(Base):
+    __tablename__ = "launch_checkpoints"
+    __table_args__ = (UniqueConstraint("service_id", "step"),)
+    id = Column(Integer, primary_key=True, index=True)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    step = Column(Enum(LaunchStep), nullable=False)
+    completed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, DateTime, Enum, Integer, String, UniqueConstraint, func
+
+from core.magic import ImageState
+from db.base_class import Base
+
+
+class MachineImage(Base):
+    __tablename__ = "machine_images"
+    __table_args__ = (UniqueConstraint("recipe_hash", "region"),)
+    id = Column(Integer, primary_key=True, index=True)
+    recipe_hash = Column(String, nullable=False)
+    region = Column(String, nullable=False)
+    base_image_id = Column(String, nullable=False)
+    image_id = Column(String, nullable=True, default=None)
+    state = Column(Enum(ImageState), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    claimed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
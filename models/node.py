@@ -1,5 +1,5 @@
 from typing import TYPE_CHECKING
-from sqlalchemy import Column, ForeignKey, Integer, Enum, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, Enum, String, func, text
 from sqlalchemy.orm import relationship
 
 from core.magic import NodeState
@@ -12,8 +12,28 @@ if TYPE_CHECKING:
 
 class Node(Base):
     __tablename__ = "nodes"
+    __table_args__ = (
+        # Warm pool claims and counts only look at standby nodes
+        Index(
+            "ix_nodes_standby_pool", "region", "instance_type", "image_id",
+            postgresql_where=text("value = 'standby'"),
+        ),
+        # The reconciler sweeps launched nodes that are not terminated yet
+        Index(
+            "ix_nodes_active_instance_id", "instance_id",
+            postgresql_where=text("value <> 'terminated' AND instance_id IS NOT NULL"),
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True)
     state = Column('value', Enum(NodeState))
-    service_id = Column(Integer, ForeignKey("services.id"))
+    service_id = Column(Integer, ForeignKey("services.id"), index=True)
     owning_service = relationship("Service", back_populates="nodes")
     public_ip_address = Column(String, nullable=True, default=None)
+    instance_id = Column(String, index=True, unique=True, nullable=True, default=None)
+    region = Column(String, nullable=True, default=None)
+    instance_type = Column(String, nullable=True, default=None)
+    image_id = Column(String, nullable=True, default=None)
+    from_warm_pool = Column(Boolean, nullable=False, default=False, server_default="false")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    missed_sweeps = Column(Integer, nullable=False, default=0, server_default="0")
+    """Consecutive complete reconciler sweeps the instance was missing from."""
@@ -1,8 +1,8 @@
 from typing import TYPE_CHECKING
-from sqlalchemy import Column, Integer, String, Enum
+from sqlalchemy import Column, DateTime, Index, Integer, String, Enum, func
 from sqlalchemy.orm import relationship
 
-from core.magic import ServiceState
+from core.magic import AWS_DEFAULT_REGION, ServiceState
 from db.base_class import Base
 
 if TYPE_CHECKING:
@@ -12,9 +12,18 @@ if TYPE_CHECKING:
 
 class Service(Base):
     __tablename__ = "services"
+    __table_args__ = (
+        # Keyset pages filtered by state
+        Index("ix_services_value_id", "value", "id"),
+        # Name prefix filters, independent of the database collation
+        Index("ix_services_name_pattern", "name", postgresql_ops={"name": "text_pattern_ops"}),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, unique=True)
     state = Column('value', Enum(ServiceState))
+    region = Column(String, nullable=False, default=AWS_DEFAULT_REGION, server_default=AWS_DEFAULT_REGION)
     nodes = relationship("Node", back_populates="owning_service")
     key_pairs = relationship("KeyPair", back_populates="owning_service")
     public_ip_address = Column(String, nullable=True, default=None)
+    # Validates cached responses together with the version counters in redis
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, index=True)
@@ -0,0 +1,125 @@
+"""Dedicated consumer running the launches of its regions on the asyncio provisioning engine.
+
+Launches of the regions in `PROVISIONING_ENGINE_REGIONS` are routed to the engine queue of
+the region instead of the celery workers. A message is acknowledged once its launch
+finished, launches of a consumer that died are delivered again and resume after their
+last checkpoint. Image bakes are still left to the celery workers.
+
+    python -m provisioner --regions us-west-2 --max-launches 200
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, List
+
+from celery.utils.log import get_task_logger
+from kombu import Consumer, Message
+
+from core import metrics, tasks, tracing
+from core.config import settings
+from core.lifespan import LifespanManager
+from core.provisioning import ProvisioningEngine
+
+logger = get_task_logger(__name__)
+
+DRAIN_TIMEOUT = 1.0
+# Unacknowledged launches are delivered again after this many seconds, longer than any launch takes
+VISIBILITY_TIMEOUT = 6 * 3600
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--regions", default=",".join(settings.PROVISIONING_ENGINE_REGIONS), help="comma separated regions to serve"
+    )
+    parser.add_argument("--max-launches", type=int, default=settings.PROVISIONING_ENGINE_MAX_LAUNCHES)
+    return parser.parse_args()
+
+
+class EngineConsumer:
+    """Feeds launch messages of the engine queues to the engine.
+
+    kombu is not thread safe, receiving and acknowledging happen on one thread at a time.
+    """
+
+    def __init__(self, engine: ProvisioningEngine, regions: List[str], *, max_launches: int) -> None:
+        self.engine = engine
+        self.queues = [tasks.celery.amqp.queues[tasks.engine_queue(region)] for region in regions]
+        self.max_launches = max_launches
+        self._finished: Deque[Message] = deque()
+        self._stopping = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def stop(self) -> None:
+        logger.info("Stop consuming, wait for %s running launches", self.engine.running)
+        self._stopping.set()
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        connection = tasks.celery.connection_for_read(transport_options={"visibility_timeout": VISIBILITY_TIMEOUT})
+        with connection:
+            consumer = Consumer(connection, queues=self.queues, callbacks=[self._receive], accept=["json"])
+            # Launches stay unacknowledged while they run, the broker delivers no more than the engine runs
+            consumer.qos(prefetch_count=self.max_launches)
+            with consumer:
+                logger.info("Consume launches from %s", ", ".join(queue.name for queue in self.queues))
+                while not self._stopping.is_set():
+                    await asyncio.to_thread(self._drain, connection)
+                await self.engine.join()
+                self._acknowledge()
+
+    def _drain(self, connection) -> None:
+        self._acknowledge()
+        try:
+            connection.drain_events(timeout=DRAIN_TIMEOUT)
+        except socket.timeout:
+            pass
+
+    def _acknowledge(self) -> None:
+        while self._finished:
+            self._finished.popleft().ack()
+
+    def _receive(self, body, message: Message) -> None:
+        if message.headers.get("task") != tasks.CREATE_SERVICE_TASK:
+            logger.error("Reject task %s, the engine only runs launches", message.headers.get("task"))
+            message.reject()
+            return
+        (service_id,), kwargs, _ = body
+        parent = tracing.SpanContext.from_traceparent(message.headers.get(tracing.TRACEPARENT_HEADER))
+        self._loop.call_soon_threadsafe(self._start, service_id, kwargs["region"], parent, message)
+
+    def _start(self, service_id: int, region: str, parent: tracing.SpanContext | None, message: Message) -> None:
+        launch = self.engine.submit(service_id, region, parent)
+        launch.add_done_callback(lambda _: self._finished.append(message))
+
+
+async def serve(regions: List[str], max_launches: int) -> None:
+    loop = asyncio.get_running_loop()
+    # Every launch may hold a thread for its bootstrap hook, the others serve the short blocking calls
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_launches + settings.PROVISIONING_ENGINE_THREADS))
+    consumer = EngineConsumer(ProvisioningEngine(max_launches=max_launches), regions, max_launches=max_launches)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, consumer.stop)
+    await consumer.run()
+
+
+def main() -> None:
+    args = parse_args()
+    regions = [region for region in args.regions.split(",") if region]
+    if not regions:
+        raise SystemExit("No regions to serve, set PROVISIONING_ENGINE_REGIONS or pass --regions")
+    unrouted = set(regions) - set(settings.PROVISIONING_ENGINE_REGIONS)
+    if unrouted:
+        raise SystemExit(f"Launches in {', '.join(sorted(unrouted))} are not routed to the engine, add them to PROVISIONING_ENGINE_REGIONS")
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s: %(levelname)s/%(name)s] %(message)s")
+    LifespanManager.create_schema()
+    metrics.start_worker_exporter()
+    asyncio.run(serve(regions, args.max_launches))
+
+
+if __name__ == "__main__":
+    main()
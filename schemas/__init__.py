@@ -1,4 +1,9 @@
-from .service import Service, ServiceCreate, ServiceCreateRequest, ServiceConfig
+from .service import (
+    Service, ServiceCreate, ServiceCreateRequest, ServiceConfig, ServiceBulkCreateRequest, ServiceBulkCreateResponse
+)
 from .node import Node, NodeCreate, NodeConfig
 from .key_pair import KeyPair, KeyPairCreate
 from .common import AWSCredentials
+from .launch_checkpoint import LaunchCheckpointCreate
+from .machine_image import MachineImage, MachineImageCreate
+from .warm_pool import WarmPoolStats
@@ -5,7 +5,7 @@ class KeyPairBase(BaseModel):
     name: str
     key_fingerprint: str
     key_material: str
-    service_id: int
+    service_id: int | None
 
 
 class KeyPairCreate(KeyPairBase):
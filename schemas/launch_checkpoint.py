@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+from core.magic import LaunchStep
+
+
+class LaunchCheckpointCreate(BaseModel):
+    service_id: int
+    step: LaunchStep
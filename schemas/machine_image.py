@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+
+from core.magic import ImageState
+
+
+class MachineImageBase(BaseModel):
+    recipe_hash: str
+    region: str
+    base_image_id: str
+
+
+class MachineImageCreate(MachineImageBase):
+    pass
+
+
+class MachineImage(MachineImageBase):
+    id: int
+    image_id: str | None
+    state: ImageState
+
+    class Config:
+        orm_mode = True
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 
+from core.config import settings
 from core.magic import AWS_DEFAULT_AMI_ID, AWSInstanceType, NodeState
 
 
@@ -9,14 +10,16 @@ class NodeBase(BaseModel):
 
 class NodeCreate(NodeBase):
     state: NodeState
-    service_id: int
+    service_id: int | None
+    instance_id: str | None = None
 
 
 class Node(NodeBase):
     id: int
     state: NodeState
-    service_id: int
+    service_id: int | None
     public_ip_address: str | None
+    instance_id: str | None
 
     class Config:
         orm_mode = True
@@ -28,3 +31,16 @@ class NodeConfig(BaseModel):
     max_count: int = 1
     instance_type: AWSInstanceType = AWSInstanceType.t2_micro
     user_data: str = ""
+    baked: bool = False
+    """The image was baked from the bootstrap recipe of the service, nodes need no installation."""
+    base_image_id: str | None = None
+    """The image a baked image was built from, warm pools of the base image serve baked configs too."""
+
+    @property
+    def pool_image_id(self) -> str:
+        """The image standby nodes for this config run, pools never hold baked images."""
+        return self.base_image_id or self.image_id
+
+    @classmethod
+    def for_region(cls, region: str) -> 'NodeConfig':
+        return cls(image_id=settings.AMI_IDS[region])
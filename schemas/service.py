@@ -1,6 +1,9 @@
-from pydantic import BaseModel
+from typing import List
 
-from core.magic import ServiceState
+from pydantic import BaseModel, Field, conlist, validator
+
+from core.config import settings
+from core.magic import SERVICE_BULK_MAX_ITEMS, ServiceState
 
 
 # Shared properties
@@ -9,23 +12,41 @@ class ServiceBase(BaseModel):
 
 
 class ServiceCreateRequest(ServiceBase):
-    pass
+    region: str = Field(default_factory=lambda: settings.REGIONS[0])
+
+    @validator("region")
+    def check_region(cls, v: str) -> str:
+        if v not in settings.REGIONS:
+            raise ValueError(f"not one of the regions {', '.join(settings.REGIONS)}")
+        return v
+
+
+class ServiceBulkCreateRequest(BaseModel):
+    services: conlist(ServiceCreateRequest, min_items=1, max_items=SERVICE_BULK_MAX_ITEMS)
 
 
 class ServiceCreate(ServiceBase):
     state: ServiceState
+    region: str
 
 
 class Service(ServiceBase):
     id: int
     name: str
     state: ServiceState
+    region: str
     public_ip_address: str | None
 
     class Config:
         orm_mode = True
 
 
+class ServiceBulkCreateResponse(BaseModel):
+    created: List[Service]
+    conflicts: List[str]
+    """Names that already exist or were requested more than once."""
+
+
 class ServiceConfig(BaseModel):
     name: str
     service_id: int
@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+from core.magic import AWSInstanceType
+
+
+class WarmPoolStats(BaseModel):
+    region: str
+    instance_type: AWSInstanceType
+    image_id: str
+    size: int
+    standby: int
+    hits: int | None
+    """Claims served from the pool, None while redis is unavailable."""
+    misses: int | None
@@ -1,20 +1,40 @@
-from celery import Celery, Task
+from celery import Celery, Task, chord, group
+from celery.signals import worker_init
 from celery.utils.log import get_task_logger
 
 import crud
-import models
 import schemas
+from core import aws, images, reconciler, tasks, warm_pool
 from core.config import settings
-from core.magic import ServiceState
-from core.services import PGService
-from db.session import SessionLocal
+from core.lifespan import LifespanManager
+from core.magic import AWS_DEFAULT_REGION, ImageState, LaunchStep
+from core.services import PGService, build_service
+from core.services.factory import bake_wanted, recipe_hash
+from db.unit_of_work import UnitOfWork
 
 celery = Celery(__name__)
-celery.conf.broker_url = settings.CELERY_BROKER_URL
-celery.conf.result_backend = settings.CELERY_BROKER_URL
+tasks.configure(celery)
+celery.conf.beat_schedule = {
+    "reconcile-nodes": {
+        "task": "reconcile_nodes_task",
+        "schedule": settings.RECONCILE_INTERVAL,
+        # A sweep that could not start before the next one is due is redundant
+        "options": {"expires": settings.RECONCILE_INTERVAL},
+    },
+    "refill-warm-pools": {
+        "task": "refill_warm_pools_task",
+        "schedule": settings.WARM_POOL_REFILL_INTERVAL,
+        "options": {"expires": settings.WARM_POOL_REFILL_INTERVAL},
+    },
+}
 logger = get_task_logger(__name__)
 
 
+@worker_init.connect(weak=False)
+def create_schema(**kwargs) -> None:
+    LifespanManager.create_schema()
+
+
 class BaseServiceTask(Task):
     def __call__(self, *args, **kwargs):
         logger.info(
@@ -22,21 +42,91 @@ class BaseServiceTask(Task):
         return self.run(*args, **kwargs)
 
 
-@celery.task(base=BaseServiceTask, name="create_service_task")
-def create_service_task(service_id: int) -> bool:
-    session = SessionLocal()
-    service_db = crud.service.get(db=session, id=service_id)
-    service = schemas.Service.from_orm(service_db)
-    if service is None:
-        raise RuntimeError("Service does not exist")
-
-    # create service with node and service config
-    aws_credentials = schemas.AWSCredentials.from_settings()
-    node_config = schemas.NodeConfig()
-    service_config = schemas.ServiceConfig(
-        name=service.name, service_id=service.id)
-    base_service = PGService(
-        aws_credentials=aws_credentials, node_config=node_config, service_config=service_config
-    )
-    base_service.launch()
+@celery.task(base=BaseServiceTask, name=tasks.CREATE_SERVICE_TASK)
+def create_service_task(service_id: int, region: str = AWS_DEFAULT_REGION) -> bool:
+    """Dispatch the launch workflow of a service in its region.
+
+    Key pair and security group do not depend on each other and are created concurrently,
+    the nodes are launched once both exist and bootstrapped afterwards. Every step is
+    checkpointed, dispatching the workflow again resumes after the last completed step.
+    All steps are routed to the queue of the region.
+    """
+    def step(launch_step: LaunchStep):
+        return launch_step_task.si(service_id, launch_step.value, region=region)
+
+    workflow = chord(
+        group(step(LaunchStep.key_pair), step(LaunchStep.security_group)),
+        step(LaunchStep.nodes),
+    ) | step(LaunchStep.bootstrap)
+    workflow.apply_async()
+    if settings.IMAGE_BAKING_ENABLED:
+        with UnitOfWork() as uow:
+            wanted = bake_wanted(uow.session, region)
+        if wanted:
+            # Later launches use the baked image, this one installs over SSH meanwhile
+            bake_image_task.delay(region=region)
     return True
+
+
+@celery.task(base=BaseServiceTask, name=tasks.BAKE_IMAGE_TASK)
+def bake_image_task(region: str) -> str | None:
+    """Bake the image of the bootstrap recipe unless it exists or another worker bakes it."""
+    aws_credentials = schemas.AWSCredentials.from_settings(region=region)
+    base_node_config = schemas.NodeConfig.for_region(region)
+    image_in = schemas.MachineImageCreate(
+        recipe_hash=recipe_hash(base_node_config), region=region, base_image_id=base_node_config.image_id
+    )
+    with UnitOfWork() as uow:
+        session = uow.session
+        if not crud.machine_image.claim(db=session, obj_in=image_in):
+            return None
+        baker = images.ImageBaker(
+            aws.get_ec2_resource(aws_credentials), aws.get_ec2_client(aws_credentials),
+            timeout=settings.IMAGE_BAKE_TIMEOUT
+        )
+        try:
+            image_id = baker.bake(
+                PGService.bootstrap_recipe,
+                base_image_id=base_node_config.image_id, instance_type=base_node_config.instance_type
+            )
+        except Exception:
+            crud.machine_image.set_state(
+                db=session, recipe_hash=image_in.recipe_hash, region=region, state=ImageState.failed
+            )
+            raise
+        crud.machine_image.set_state(
+            db=session, recipe_hash=image_in.recipe_hash, region=region, state=ImageState.available, image_id=image_id
+        )
+        return image_id
+
+
+@celery.task(
+    base=BaseServiceTask, name="launch_step_task",
+    autoretry_for=(Exception,), retry_backoff=True, max_retries=settings.LAUNCH_STEP_MAX_RETRIES,
+)
+def launch_step_task(service_id: int, step: str, region: str | None = None) -> str:
+    # The region only routes the task, the service record is authoritative
+    with UnitOfWork() as uow:
+        build_service(uow, service_id).run_step(LaunchStep(step))
+    return step
+
+
+@celery.task(name="reconcile_nodes_task")
+def reconcile_nodes_task() -> int:
+    with UnitOfWork() as uow:
+        changed = reconciler.reconcile(
+            uow, settings.RECONCILE_REGIONS, max_pages=settings.RECONCILE_MAX_PAGES
+        )
+    return changed
+
+
+@celery.task(name="refill_warm_pools_task")
+def refill_warm_pools_task() -> int:
+    launched = 0
+    with UnitOfWork() as uow:
+        for pool in settings.WARM_POOLS:
+            aws_credentials = schemas.AWSCredentials.from_settings(region=pool.region)
+            launched += warm_pool.refill(
+                uow.session, aws.get_ec2_resource(aws_credentials), aws.get_ec2_client(aws_credentials), pool
+            )
+    return launched